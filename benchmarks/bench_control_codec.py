@@ -0,0 +1,66 @@
+"""
+Control codec microbenchmark
+
+Compares encode/decode time and wire size of the JSON line encoding and
+the negotiated binary encoding for the hot control messages.
+
+Usage: python benchmarks/bench_control_codec.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from protocol import ControlFramer, decode_frame, encode_binary, encode_json
+
+ITERATIONS = 20000
+
+SAMPLES = {
+    "cursor_move": {"type": "cursor_move", "x": 412, "y": 287},
+    "cursor_batch": {"type": "cursor_batch", "cursors": [
+        {"from": f"user{i}", "x": 100 + i, "y": 200 + i, "color": "#4C88FF"} for i in range(10)
+    ]},
+    "gesture": {"type": "gesture", "from": "alice", "gesture_type": "thumbs_up"},
+    "whiteboard_draw": {
+        "type": "whiteboard_action",
+        "from": "alice",
+        "action": "draw",
+        "data": {
+            "id": "5f0c6a1e-8d5b-4a77-9a7d-3f3b1c2d4e5f",
+            "points": [{"x": 100 + i, "y": 200 + (i % 17)} for i in range(120)],
+            "color": "#000000",
+            "width": 3,
+            "timestamp": 1760000000.123456
+        },
+        "erase_id": None,
+        "version": 42
+    },
+}
+
+
+def bench(label, obj):
+    raw_json = encode_json(obj)
+    raw_bin = encode_binary(obj)
+    json_frame = ControlFramer().feed(raw_json)[0]
+    bin_frame = ControlFramer().feed(raw_bin)[0]
+
+    enc_json = timeit.timeit(lambda: encode_json(obj), number=ITERATIONS)
+    enc_bin = timeit.timeit(lambda: encode_binary(obj), number=ITERATIONS)
+    dec_json = timeit.timeit(lambda: decode_frame(json_frame), number=ITERATIONS)
+    dec_bin = timeit.timeit(lambda: decode_frame(bin_frame), number=ITERATIONS)
+
+    us = 1e6 / ITERATIONS
+    print(f"{label:16s} | bytes json={len(raw_json):5d} bin={len(raw_bin):5d} "
+          f"| encode json={enc_json * us:6.2f}us bin={enc_bin * us:6.2f}us "
+          f"| decode json={dec_json * us:6.2f}us bin={dec_bin * us:6.2f}us")
+
+
+def main():
+    for label, obj in SAMPLES.items():
+        bench(label, obj)
+
+
+if __name__ == "__main__":
+    main()
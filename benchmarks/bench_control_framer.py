@@ -0,0 +1,75 @@
+"""
+Control framer benchmark
+
+Feeds 10k control messages per recv into ControlFramer and into the old
+`buf += data; buf.split(b"\\n", 1)` loop, and also replays a large
+whiteboard_sync arriving in 4 KiB reads.
+
+Usage: python benchmarks/bench_control_framer.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from protocol import ControlFramer, encode_json
+
+MESSAGES_PER_RECV = 10000
+RECVS = 5
+
+
+class SplitFramer:
+    """The framing loop previously used by handle_control and tcp_receiver_loop"""
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        frames = []
+        self.buf += data
+        while b"\n" in self.buf:
+            line, self.buf = self.buf.split(b"\n", 1)
+            if line:
+                frames.append((False, line))
+        return frames
+
+
+def many_small():
+    msg = encode_json({"type": "chat", "from": "alice", "message": "hello everyone"})
+    return [msg * MESSAGES_PER_RECV for _ in range(RECVS)]
+
+
+def large_sync():
+    strokes = [{
+        "id": f"stroke-{i}",
+        "points": [{"x": j, "y": j * 2} for j in range(50)],
+        "color": "#000000",
+        "width": 3,
+        "timestamp": 1760000000.0
+    } for i in range(1000)]
+    raw = encode_json({"type": "whiteboard_sync", "state": {"strokes": strokes, "shapes": [], "texts": [], "version": 1000}})
+    return [raw[i:i + 4096] for i in range(0, len(raw), 4096)]
+
+
+def run(framer_cls, chunks):
+    framer = framer_cls()
+    start = time.perf_counter()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    return time.perf_counter() - start, count
+
+
+def main():
+    for label, chunks in (("10k msgs/recv", many_small()), ("whiteboard_sync 4KiB reads", large_sync())):
+        size = sum(len(c) for c in chunks)
+        print(f"{label} ({len(chunks)} recvs, {size / 1024:.0f} KiB)")
+        for framer_cls in (SplitFramer, ControlFramer):
+            elapsed, count = run(framer_cls, chunks)
+            print(f"  {framer_cls.__name__:14s} {elapsed * 1000:9.2f} ms  ({count} frames)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Control server benchmark
+
+Measures join latency, chat fan-out latency and the time to deliver a
+burst of chat messages with the asyncio control server at 10/50/200
+connected clients.
+
+Usage: python benchmarks/bench_control_server.py [client counts...]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import server
+
+HOST = "127.0.0.1"
+FANOUT_MESSAGES = 20
+BURST_MESSAGES = 200
+
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind((HOST, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_control_server(port):
+    threading.Thread(target=asyncio.run, args=(server.control_server(HOST, port),), daemon=True).start()
+    deadline = time.time() + 5.0
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("control server did not start")
+
+
+class BenchClient:
+    def __init__(self, name):
+        self.name = name
+        self.reader = None
+        self.writer = None
+        self.joined = None
+        self.chats = {}
+
+    async def join(self, port):
+        self.reader, self.writer = await asyncio.open_connection(HOST, port)
+        self.joined = asyncio.get_running_loop().create_future()
+        self.writer.write((json.dumps({
+            "type": "hello",
+            "name": self.name,
+            "password": server.SERVER_PASSWORD,
+        }) + "\n").encode())
+        start = time.perf_counter()
+        asyncio.get_running_loop().create_task(self.read_loop())
+        await self.joined
+        return time.perf_counter() - start
+
+    async def read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            msg = json.loads(line)
+            mtype = msg.get("type")
+            if mtype == "user_list" and not self.joined.done():
+                self.joined.set_result(True)
+            elif mtype == "chat":
+                self.chats[msg["message"]] = time.perf_counter()
+
+    def send(self, obj):
+        self.writer.write((json.dumps(obj) + "\n").encode())
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def run_round(port, count):
+    clients = [BenchClient(f"bench{count}_{i}") for i in range(count)]
+
+    join_times = []
+    for c in clients:
+        join_times.append(await c.join(port))
+
+    fanout_times = []
+    for i in range(FANOUT_MESSAGES):
+        tag = f"m{count}_{i}"
+        start = time.perf_counter()
+        clients[i % count].send({"type": "chat", "message": tag})
+        while not all(tag in c.chats for c in clients):
+            await asyncio.sleep(0.0005)
+        fanout_times.append(max(c.chats[tag] for c in clients) - start)
+
+    burst_tags = [f"b{count}_{i}" for i in range(BURST_MESSAGES)]
+    start = time.perf_counter()
+    for i, tag in enumerate(burst_tags):
+        clients[i % count].send({"type": "chat", "message": tag})
+    last = burst_tags[-1]
+    while not all(last in c.chats for c in clients):
+        await asyncio.sleep(0.0005)
+    burst_time = max(c.chats[last] for c in clients) - start
+
+    for c in clients:
+        await c.close()
+    await asyncio.sleep(0.2)
+    return join_times, fanout_times, burst_time
+
+
+def fmt(values):
+    values = sorted(values)
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return f"p50={statistics.median(values) * 1000:7.2f}ms  p99={p99 * 1000:7.2f}ms"
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    counts = [int(a) for a in sys.argv[1:]] or [10, 50, 200]
+
+    port = free_port()
+    start_control_server(port)
+
+    for count in counts:
+        join_times, fanout_times, burst_time = asyncio.run(run_round(port, count))
+        print(f"{count:4d} clients | join {fmt(join_times)} | fan-out {fmt(fanout_times)} "
+              f"| {BURST_MESSAGES}-msg burst {burst_time * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
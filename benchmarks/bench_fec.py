@@ -0,0 +1,76 @@
+"""
+Video FEC benchmark
+
+Sends the same frames through media.FrameAssembler under simulated random
+and bursty packet loss, with FEC off and with parity groups of 8, 4 and
+2 chunks, and reports the share of frames delivered against the extra
+bandwidth spent on parity.
+
+Usage: python benchmarks/bench_fec.py [frames] [frame bytes]
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from media import VIDEO_CHUNK, VIDEO_HEADER, FrameAssembler, pack_video_chunks
+
+FEC_GROUPS = (0, 8, 4, 2)
+LOSS_RATES = (0.01, 0.02, 0.05, 0.10)
+BURST_LENGTH = 3
+
+
+def lose(packets, rate, bursty, rng):
+    """Drop packets independently, or in runs of BURST_LENGTH at the same average rate"""
+    kept = []
+    skip = 0
+    for packet in packets:
+        if skip:
+            skip -= 1
+            continue
+        if bursty:
+            if rng.random() < rate / BURST_LENGTH:
+                skip = BURST_LENGTH - 1
+                continue
+        elif rng.random() < rate:
+            continue
+        kept.append(packet)
+    return kept
+
+
+def run(payload, frames, fec_group, rate, bursty, seed):
+    rng = random.Random(seed)
+    assembler = FrameAssembler()
+    sent = data_bytes = delivered = 0
+    for frame_id in range(frames):
+        packets = pack_video_chunks(payload, frame_id, fec_group=fec_group)
+        sent += sum(len(p) for p in packets)
+        data_bytes += sum(len(p) for p in packets if VIDEO_HEADER.unpack_from(p)[4] < VIDEO_HEADER.unpack_from(p)[5])
+        for packet in lose(packets, rate, bursty, rng):
+            layer, _, group, fid, index, count, total, _ = VIDEO_HEADER.unpack_from(packet)
+            frame = assembler.add(layer, fid, index, count, total, memoryview(packet)[VIDEO_HEADER.size:], group)
+            if frame is not None and frame == payload:
+                delivered += 1
+    return delivered / frames, sent / data_bytes - 1, assembler.stats["fec_recovered"]
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    frame_size = int(sys.argv[2]) if len(sys.argv) > 2 else 9 * VIDEO_CHUNK - 300
+    payload = random.Random(0).randbytes(frame_size)
+
+    for bursty in (False, True):
+        print(f"{'bursty' if bursty else 'random'} loss, {frame_size} byte frames")
+        for rate in LOSS_RATES:
+            cells = []
+            for fec_group in FEC_GROUPS:
+                ok, overhead, recovered = run(payload, frames, fec_group, rate, bursty, seed=int(rate * 1000))
+                label = f"group {fec_group}" if fec_group else "no fec"
+                cells.append(f"{label} {100 * ok:5.1f}% (+{100 * overhead:4.1f}%)")
+            print(f"  loss {100 * rate:4.1f}% | " + " | ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Video frame reassembly benchmark
+
+Feeds the same chunk stream, with simulated loss and reordering, to the
+old in-order "data += chunk" reassembly and to media.FrameAssembler, and
+reports frames recovered and chunks processed per second.
+
+Usage: python benchmarks/bench_frame_assembler.py [frames] [frame bytes]
+"""
+
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from media import VIDEO_CHUNK, VIDEO_HEADER, FrameAssembler, pack_video_chunks
+
+SOURCES = 4
+SCENARIOS = [
+    ("clean", 0.0, 0.0),
+    ("reorder 5%", 0.0, 0.05),
+    ("loss 1%", 0.01, 0.0),
+    ("loss 1% + reorder 5%", 0.01, 0.05),
+]
+
+
+def make_stream(payload, frames, loss, reorder, rng):
+    """Interleaved (src, packet) pairs with both header layouts, after loss and local reordering"""
+    stream = []
+    for frame_id in range(frames):
+        for src in range(SOURCES):
+            for packet in pack_video_chunks(payload, frame_id):
+                if rng.random() < loss:
+                    continue
+                _, _, _, _, index, _, total, _ = VIDEO_HEADER.unpack_from(packet)
+                legacy = struct.pack('!II', index, total) + packet[VIDEO_HEADER.size:]
+                stream.append((src, packet, legacy))
+    for i in range(len(stream) - 1):
+        if rng.random() < reorder:
+            j = min(len(stream) - 1, i + rng.randint(1, 3))
+            stream[i], stream[j] = stream[j], stream[i]
+    return stream
+
+
+def legacy_reassembly(stream, payload):
+    """The receive loop before frame ids: in-order append, reset on seq 0"""
+    frame_buffers = {}
+    done = 0
+    for src, _, packet in stream:
+        seq, total_size = struct.unpack('!II', packet[:8])
+        chunk = packet[8:]
+        if src not in frame_buffers:
+            frame_buffers[src] = {"data": b"", "total": total_size, "seq": 0}
+        buf = frame_buffers[src]
+        if seq == 0:
+            buf["data"] = b""
+            buf["total"] = total_size
+            buf["seq"] = 0
+        if seq == buf["seq"]:
+            buf["data"] += chunk
+            buf["seq"] += 1
+        if len(buf["data"]) >= buf["total"]:
+            # A lost chunk can splice the next frame's chunks into this one
+            if buf["data"][:buf["total"]] == payload:
+                done += 1
+            frame_buffers[src] = {"data": b"", "total": 0, "seq": 0}
+    return done
+
+
+def assembler_reassembly(stream, payload):
+    assembler = FrameAssembler()
+    done = 0
+    for src, packet, _ in stream:
+        _, _, _, frame_id, index, count, total, _ = VIDEO_HEADER.unpack_from(packet)
+        frame = assembler.add(src, frame_id, index, count, total, memoryview(packet)[VIDEO_HEADER.size:])
+        if frame is not None and frame == payload:
+            done += 1
+    return done
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    frame_size = int(sys.argv[2]) if len(sys.argv) > 2 else 9 * VIDEO_CHUNK - 300
+    rng = random.Random(1)
+    expected = frames * SOURCES
+    payload = bytes(rng.randrange(256) for _ in range(frame_size))
+
+    for label, loss, reorder in SCENARIOS:
+        stream = make_stream(payload, frames, loss, reorder, rng)
+        results = []
+        for fn in (legacy_reassembly, assembler_reassembly):
+            start = time.perf_counter()
+            done = fn(stream, payload)
+            elapsed = time.perf_counter() - start
+            results.append(f"{100 * done / expected:5.1f}% frames {len(stream) / elapsed / 1000:7.0f}k chunk/s")
+        print(f"{label:22s} | legacy {results[0]} | assembler {results[1]}")
+
+
+if __name__ == "__main__":
+    main()
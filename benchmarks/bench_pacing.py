@@ -0,0 +1,154 @@
+"""
+Video pacing benchmark
+
+Several senders start a frame at the same moment every 50 ms, like cameras
+running at 20 fps, and a receiver with a small socket buffer drains it
+every few milliseconds, like a busy server or client. Reports packet loss
+and complete frames with the packets of each frame sent back to back and
+paced over the frame interval the way client.video_packet_sender_loop
+does, then the same for the server's fan-out output with unpaced senders
+and VIDEO_FORWARD_PACE_BITRATE off and on.
+
+Usage: python benchmarks/bench_pacing.py [senders] [frame bytes] [seconds]
+"""
+
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import server
+from media import VIDEO_CHUNK, VIDEO_HEADER, FrameAssembler, Pacer, pack_video_chunks
+
+HOST = "127.0.0.1"
+FPS = 20
+PACE_SPREAD = 0.8
+PACE_BURST = 4 * (VIDEO_CHUNK + VIDEO_HEADER.size)
+SINK_RCVBUF = 64 * 1024
+DRAIN_INTERVAL = 0.01
+
+
+def sink_process(conn, seconds, tag_len):
+    """Receiver with a small buffer that only reads every DRAIN_INTERVAL"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SINK_RCVBUF)
+    sock.bind((HOST, 0))
+    sock.setblocking(False)
+    conn.send(sock.getsockname()[1])
+
+    assembler = FrameAssembler(timeout=1.0)
+    packets = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(DRAIN_INTERVAL)
+        try:
+            while True:
+                data, addr = sock.recvfrom(2048)
+                packets += 1
+                _, _, group, frame_id, index, count, total, _ = VIDEO_HEADER.unpack_from(data, tag_len)
+                assembler.add((addr, data[:tag_len]), frame_id, index, count, total,
+                              data[tag_len + VIDEO_HEADER.size:], group)
+        except BlockingIOError:
+            pass
+    conn.send((packets, assembler.stats["completed"]))
+
+
+def sender_process(index, port, frame_bytes, start_at, seconds, paced, sent):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    # A loopback address per sender, so the forwarder tags each one as its own source
+    sock.bind((f"127.0.0.{index + 2}", 0))
+    payload = random.Random(index).randbytes(frame_bytes)
+    interval = 1.0 / FPS
+    pacer = Pacer(1.0, PACE_BURST)
+    count = 0
+    frame_id = 0
+    next_due = start_at
+    while next_due < start_at + seconds:
+        delay = next_due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        packets = pack_video_chunks(payload, frame_id)
+        pacer.rate = sum(len(p) for p in packets) / (PACE_SPREAD * interval)
+        for packet in packets:
+            if paced:
+                pacer.wait(len(packet))
+            sock.sendto(packet, (HOST, port))
+        count += len(packets)
+        frame_id += 1
+        next_due += interval
+    sent.value = count
+
+
+def run(port_of, senders, frame_bytes, seconds, paced, tag_len):
+    """Start a sink, point the senders at port_of(sink port), return (loss, frames delivered)"""
+    parent, child = multiprocessing.Pipe()
+    sink = multiprocessing.Process(target=sink_process, args=(child, seconds + 0.5, tag_len))
+    sink.start()
+    target = port_of(parent.recv())
+
+    start_at = time.monotonic() + 0.2
+    counters = [multiprocessing.Value('q', 0) for _ in range(senders)]
+    procs = [multiprocessing.Process(target=sender_process,
+                                     args=(i, target, frame_bytes, start_at, seconds, paced, counters[i]))
+             for i in range(senders)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    received, completed = parent.recv()
+    sink.join()
+
+    sent = sum(c.value for c in counters)
+    frames = senders * round(seconds * FPS)
+    return 1 - received / sent, completed / frames
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    senders = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    frame_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 30_000
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    offered = senders * frame_bytes * FPS * 8
+    print(f"{senders} senders x {frame_bytes} byte frames at {FPS} fps ({offered / 1e6:.1f} Mbit/s), "
+          f"receiver buffer {SINK_RCVBUF // 1024} KB drained every {DRAIN_INTERVAL * 1000:.0f} ms")
+
+    for paced in (False, True):
+        loss, delivered = run(lambda port: port, senders, frame_bytes, seconds, paced, 0)
+        print(f"sender    {'paced' if paced else 'burst'} | packet loss {100 * loss:5.1f}% "
+              f"| frames delivered {100 * delivered:5.1f}%")
+
+    # Same receiver behind the server's forwarder, fed by unpaced senders
+    server.video_sock.bind((HOST, 0))
+    forwarder_port = server.video_sock.getsockname()[1]
+    threading.Thread(target=server.video_forwarder, daemon=True).start()
+    while len(server.video_workers) < server.VIDEO_FANOUT_WORKERS:
+        time.sleep(0.01)
+
+    sinks = []
+
+    def via_forwarder(sink_port):
+        info = {"conn": object(), "name": "sink", "addr": (HOST, 0), "video_port": sink_port, "audio_port": 0}
+        with server.clients_lock:
+            for old in sinks:
+                server.remove_media_targets(old)
+            server.add_media_targets(info["conn"], info["name"], HOST, sink_port, 0)
+        sinks[:] = [info]
+        return forwarder_port
+
+    for rate in (0, 1.5 * offered):
+        for worker in server.video_workers:
+            worker.pacer = Pacer(rate / 8, server.VIDEO_FORWARD_PACE_BURST) if rate else None
+        loss, delivered = run(via_forwarder, senders, frame_bytes, seconds, False, 4)
+        label = f"paced {rate / 1e6:.0f} Mbit/s" if rate else "burst"
+        print(f"forwarder {label} | packet loss {100 * loss:5.1f}% | frames delivered {100 * delivered:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
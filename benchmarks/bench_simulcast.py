@@ -0,0 +1,104 @@
+"""
+Simulcast cost/benefit benchmark
+
+Encodes the same frames the way video_sender_loop does, once as a single
+full layer and once as simulcast (high + low layer), and reports the
+sender's extra CPU per second of video against the downstream bytes saved
+for rooms of 4, 9 and 16 participants. Each receiver gets the high layer
+only for its main tile; client._redraw_video only draws a main tile with
+three or fewer videos, so the "main tile" column shows the saving for a
+layout that keeps one large tile.
+
+Usage: python benchmarks/bench_simulcast.py [video file] [frames]
+"""
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from media import VIDEO_CHUNK, VIDEO_HEADER
+
+VIDEO_WIDTH, VIDEO_HEIGHT, JPEG_QUALITY = 320, 240, 80
+LOW_WIDTH, LOW_HEIGHT, LOW_JPEG_QUALITY = 160, 120, 50
+VIDEO_FPS = 20
+ROOM_SIZES = (4, 9, 16)
+
+
+def synthetic_frames(count):
+    """Textured background with a moving block, roughly webcam-like for JPEG"""
+    rng = np.random.default_rng(1)
+    base = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (9, 9), 0)
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 7) % 520
+        cv2.rectangle(frame, (x, 150), (x + 120, 330), (40, 180, 220), -1)
+        frame += rng.integers(0, 6, frame.shape, dtype=np.uint8)
+        yield frame
+
+
+def clip_frames(path, count):
+    cap = cv2.VideoCapture(path)
+    for _ in range(count):
+        ok, frame = cap.read()
+        if not ok:
+            break
+        yield frame
+    cap.release()
+
+
+def wire_bytes(payload_len):
+    chunks = -(-payload_len // VIDEO_CHUNK)
+    return payload_len + chunks * (VIDEO_HEADER.size + 4)
+
+
+def encode(frames, simulcast):
+    high_bytes = low_bytes = 0
+    start = time.process_time()
+    for frame in frames:
+        frame = cv2.resize(frame, (VIDEO_WIDTH, VIDEO_HEIGHT))
+        _, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        high_bytes += wire_bytes(len(buf))
+        if simulcast:
+            thumb = cv2.resize(frame, (LOW_WIDTH, LOW_HEIGHT), interpolation=cv2.INTER_AREA)
+            _, buf = cv2.imencode('.jpg', thumb, [cv2.IMWRITE_JPEG_QUALITY, LOW_JPEG_QUALITY])
+            low_bytes += wire_bytes(len(buf))
+    return time.process_time() - start, high_bytes, low_bytes
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    frames = list(clip_frames(path, count) if path else synthetic_frames(count))
+    n = len(frames)
+
+    single_cpu, full_bytes, _ = encode(frames, simulcast=False)
+    sim_cpu, high_bytes, low_bytes = encode(frames, simulcast=True)
+
+    full_kbps = full_bytes / n * VIDEO_FPS * 8 / 1000
+    high_kbps = high_bytes / n * VIDEO_FPS * 8 / 1000
+    low_kbps = low_bytes / n * VIDEO_FPS * 8 / 1000
+    single_cpu_pct = single_cpu / n * VIDEO_FPS * 100
+    sim_cpu_pct = sim_cpu / n * VIDEO_FPS * 100
+
+    print(f"{n} frames at {VIDEO_FPS} fps")
+    print(f"upstream   | single {single_cpu / n * 1000:6.2f} ms/frame ({single_cpu_pct:5.1f}% core) {full_kbps:7.0f} kbit/s "
+          f"| simulcast {sim_cpu / n * 1000:6.2f} ms/frame ({sim_cpu_pct:5.1f}% core) {high_kbps + low_kbps:7.0f} kbit/s")
+
+    for size in ROOM_SIZES:
+        remote = size - 1
+        before = remote * full_kbps
+        grid = remote * low_kbps
+        main_tile = high_kbps + (remote - 1) * low_kbps
+        print(f"{size:2d} people | per receiver: single {before:7.0f} kbit/s | simulcast grid {grid:7.0f} kbit/s "
+              f"({100 * (1 - grid / before):4.1f}% less) | simulcast main tile {main_tile:7.0f} kbit/s "
+              f"({100 * (1 - main_tile / before):4.1f}% less) | server egress saved "
+              f"{size * (before - grid) / 1000:6.2f} Mbit/s for +{sim_cpu_pct - single_cpu_pct:4.1f}% core per sender")
+
+
+if __name__ == "__main__":
+    main()
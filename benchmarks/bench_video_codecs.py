@@ -0,0 +1,100 @@
+"""
+Video codec benchmark
+
+Encodes recorded clips the way video_sender_loop does (320x240 at 20 fps,
+quality from the top of the ladder) with per-frame JPEG and with H.264 at
+a few keyframe intervals, then decodes them again, and reports wire
+bandwidth, encode and decode CPU per frame, and PSNR against the source
+frames so the bitrates compare at similar quality. H.264 needs PyAV.
+
+Usage: python benchmarks/bench_video_codecs.py clip.mp4 [clip.mp4 ...] [--frames N]
+"""
+
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from media import VIDEO_CHUNK, VIDEO_HEADER
+from video_codec import AV_AVAILABLE, H264Decoder, H264Encoder, JpegDecoder, JpegEncoder
+
+VIDEO_WIDTH, VIDEO_HEIGHT, QUALITY, VIDEO_FPS = 320, 240, 80, 20
+KEYFRAME_INTERVALS = (20, 60, 200)
+
+
+def clip_frames(path, count):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, (VIDEO_WIDTH, VIDEO_HEIGHT), interpolation=cv2.INTER_AREA))
+    cap.release()
+    return frames
+
+
+def wire_bytes(payload_len):
+    chunks = max(1, -(-payload_len // VIDEO_CHUNK))
+    return payload_len + chunks * (VIDEO_HEADER.size + 4)
+
+
+def run(frames, encoder, decoder):
+    sent = keyframes = 0
+    encode_cpu = decode_cpu = psnr = 0.0
+    decoded = 0
+    for frame in frames:
+        start = time.process_time()
+        data, keyframe = encoder.encode(frame, QUALITY, VIDEO_FPS)
+        encode_cpu += time.process_time() - start
+        if not data:
+            continue
+        sent += wire_bytes(len(data))
+        keyframes += keyframe
+
+        start = time.process_time()
+        image = decoder.decode(data)
+        decode_cpu += time.process_time() - start
+        if image is not None:
+            decoded += 1
+            psnr += cv2.PSNR(frame, image)
+    n = len(frames)
+    return (sent / n * VIDEO_FPS * 8 / 1000, 1000 * encode_cpu / n, 1000 * decode_cpu / max(decoded, 1),
+            psnr / max(decoded, 1), keyframes)
+
+
+def main():
+    args = sys.argv[1:]
+    count = 600
+    if "--frames" in args:
+        i = args.index("--frames")
+        count = int(args[i + 1])
+        del args[i:i + 2]
+    if not args:
+        sys.exit(__doc__)
+    if not AV_AVAILABLE:
+        print("PyAV not installed, only measuring JPEG")
+
+    for path in args:
+        frames = clip_frames(path, count)
+        if not frames:
+            print(f"{path}: no frames")
+            continue
+        print(f"{os.path.basename(path)}: {len(frames)} frames at {VIDEO_WIDTH}x{VIDEO_HEIGHT}, {VIDEO_FPS} fps")
+        codecs = [("jpeg", JpegEncoder(), JpegDecoder())]
+        if AV_AVAILABLE:
+            codecs += [(f"h264 key/{k}", H264Encoder(k), H264Decoder()) for k in KEYFRAME_INTERVALS]
+        jpeg_kbps = None
+        for label, encoder, decoder in codecs:
+            kbps, encode_ms, decode_ms, psnr, keyframes = run(frames, encoder, decoder)
+            jpeg_kbps = jpeg_kbps or kbps
+            print(f"  {label:13s} | {kbps:7.0f} kbit/s ({100 * kbps / jpeg_kbps:5.1f}% of jpeg) "
+                  f"| encode {encode_ms:5.2f} ms/frame ({encode_ms * VIDEO_FPS / 10:4.1f}% core) "
+                  f"| decode {decode_ms:5.2f} ms/frame | PSNR {psnr:5.2f} dB | {keyframes} keyframes")
+
+
+if __name__ == "__main__":
+    main()
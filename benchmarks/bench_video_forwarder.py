@@ -0,0 +1,147 @@
+"""
+Video forwarder benchmark
+
+Sends video-sized UDP packets at the server's video forwarder on
+localhost with 50 registered receivers, first with a stable room and then
+while the receivers continuously leave and rejoin, and reports packets per
+second in and out. The sender and the receivers run in separate processes
+so they do not compete with the forwarder for the GIL.
+
+Usage: python benchmarks/bench_video_forwarder.py [receivers] [seconds]
+"""
+
+import logging
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import server
+from media import pack_video_chunks
+
+HOST = "127.0.0.1"
+PAYLOAD = pack_video_chunks(b"\x00" * 1100, 0)[0]
+
+
+def sink_process(ports_conn, count, received):
+    """UDP sockets standing in for client video receive ports, counted in a separate process"""
+    sel = selectors.DefaultSelector()
+    ports = []
+    for _ in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        s.bind((HOST, 0))
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ)
+        ports.append(s.getsockname()[1])
+    ports_conn.send(ports)
+
+    local = 0
+    while True:
+        for key, _ in sel.select(0.05):
+            try:
+                while True:
+                    key.fileobj.recv(2048)
+                    local += 1
+            except BlockingIOError:
+                pass
+        received.value = local
+
+
+def blast_process(port, seconds, sent):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(16):
+            s.sendto(PAYLOAD, (HOST, port))
+        count += 16
+        time.sleep(0.001)
+    sent.value = count
+
+
+class FakeConn:
+    name = "bench"
+
+
+def register(infos):
+    with server.clients_lock:
+        for info in infos:
+            server.add_media_targets(info["conn"], info["name"], HOST, info["video_port"], 0)
+
+
+def churn(infos, stop):
+    """Leave and rejoin receivers one at a time, as join/leave storms do"""
+    i = 0
+    while not stop.is_set():
+        info = infos[i % len(infos)]
+        with server.clients_lock:
+            server.remove_media_targets(info)
+        with server.clients_lock:
+            server.add_media_targets(info["conn"], info["name"], HOST, info["video_port"], 0)
+        i += 1
+        time.sleep(0.0005)
+    return i
+
+
+def run(label, port, received, infos, seconds, with_churn):
+    stop = threading.Event()
+    churner = None
+    if with_churn:
+        churner = threading.Thread(target=churn, args=(infos, stop), daemon=True)
+        churner.start()
+
+    before = received.value
+    sent = multiprocessing.Value('q', 0)
+    start = time.perf_counter()
+    blaster = multiprocessing.Process(target=blast_process, args=(port, seconds, sent))
+    blaster.start()
+    blaster.join()
+    time.sleep(0.3)
+    forwarded = received.value - before
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if churner:
+        churner.join()
+
+    print(f"{label:8s} | in {sent.value / seconds:9.0f} pkt/s | out {forwarded / elapsed:9.0f} pkt/s")
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    receivers = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+    server.video_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    server.video_sock.bind((HOST, 0))
+    port = server.video_sock.getsockname()[1]
+    threading.Thread(target=server.video_forwarder, daemon=True).start()
+
+    received = multiprocessing.Value('q', 0)
+    parent_conn, child_conn = multiprocessing.Pipe()
+    multiprocessing.Process(target=sink_process, args=(child_conn, receivers, received), daemon=True).start()
+    infos = [{
+        "conn": FakeConn(),
+        "name": f"rx{i}",
+        "addr": (HOST, 0),
+        "video_port": sink_port,
+        "audio_port": 0
+    } for i, sink_port in enumerate(parent_conn.recv())]
+    register(infos)
+
+    run("stable", port, received, infos, seconds, with_churn=False)
+    run("churn", port, received, infos, seconds, with_churn=True)
+
+    stats = server.get_video_stats()
+    print(f"stages   | recv {stats['received']} | queue drops {stats['queue_drops']} "
+          f"| sent {stats['sent']} | send errors {stats['send_errors']} "
+          f"| kernel rcvbuf errors (host) {stats['kernel_rcvbuf_errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Video tile rendering benchmark
+
+Drives the client's video tile code with synthetic sources on an
+offscreen Qt platform and reports GUI-thread time per 66 ms redraw tick
+for three approaches: rebuilding every tile each tick, persistent tiles
+that convert and smooth-scale each new frame on the GUI thread, and the
+current persistent tiles that blit frames already scaled and converted
+by client._set_video_frame on the decode side. New frames arrive at
+20 fps per source, faster than the 15 Hz tick, so every tick repaints
+every source. The decode-side render cost is reported separately.
+
+Usage: python benchmarks/bench_video_tiles.py [sources...] [--ticks N]
+"""
+
+import itertools
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication, QFrame, QHBoxLayout, QLabel, QVBoxLayout, QWidget
+
+import client
+from client import ConferenceClient
+
+TICK_HZ = 15
+SOURCE_FPS = 20
+
+
+class TileHost:
+    """Just the state ConferenceClient's video methods touch"""
+
+    _redraw_video = ConferenceClient._redraw_video
+    _video_layout_plan = ConferenceClient._video_layout_plan
+    _apply_video_layout = ConferenceClient._apply_video_layout
+    _main_video_source = ConferenceClient._main_video_source
+    _set_video_frame = ConferenceClient._set_video_frame
+
+    def __init__(self):
+        self.theme = client.DARK_THEME.copy()
+        self.local_ip = "10.0.0.1"
+        self.frames_by_src = {}
+        self.rendered_by_src = {}
+        self.video_frame_seq = itertools.count(1)
+        self.video_tile_sizes = {}
+        self.active_video_sources = {}
+        self.drawn = {}
+        self.video_tiles = {}
+        self.video_layout_plan = None
+        self.no_video_label = None
+        self.video_main_source = None
+        self.video_widget = QWidget()
+        self.video_layout = QHBoxLayout(self.video_widget)
+        self.video_widget.show()
+
+    def _update_video_subscription(self):
+        pass
+
+    def gui_scaled_redraw(self):
+        """Persistent tiles, but each new frame converted and smooth-scaled on the GUI thread"""
+        active_sources = list(self.frames_by_src.keys())
+        plan = self._video_layout_plan(active_sources)
+        if plan != self.video_layout_plan:
+            self._apply_video_layout(plan)
+        for src_ip, tile in self.video_tiles.items():
+            frame = self.frames_by_src.get(src_ip)
+            if frame is None or frame is self.drawn.get(src_ip):
+                continue
+            frame_rgb = client.cv2.cvtColor(frame, client.cv2.COLOR_BGR2RGB)
+            h, w, ch = frame_rgb.shape
+            qt_image = client.QImage(frame_rgb.data, w, h, ch * w, client.QImage.Format_RGB888)
+            tile.video_label.setPixmap(client.QPixmap.fromImage(qt_image).scaled(
+                tile.video_size[0], tile.video_size[1], client.Qt.KeepAspectRatio, client.Qt.SmoothTransformation))
+            self.drawn[src_ip] = frame
+
+    def legacy_redraw(self):
+        """The pre-tile-pool redraw: delete every tile and rebuild it from the current frame"""
+        for i in reversed(range(self.video_layout.count())):
+            widget = self.video_layout.itemAt(i).widget()
+            if widget:
+                widget.deleteLater()
+        for src_ip, width, height, is_main in self._video_layout_plan(list(self.frames_by_src)):
+            tile = QFrame()
+            tile.setFixedSize(width, height)
+            tile.setStyleSheet(f"QFrame {{ background-color: {self.theme['panel']}; "
+                               f"border: {'2px' if is_main else '1px'} solid {self.theme['border']}; border-radius: 12px; }}")
+            tile_layout = QVBoxLayout(tile)
+            label_height = 32 if not is_main else 40
+            user_label = QLabel(f"👤 {src_ip}")
+            user_label.setFixedHeight(label_height)
+            user_label.setStyleSheet(f"background-color: {self.theme['border']}; color: {self.theme['text_primary']};")
+            tile_layout.addWidget(user_label)
+            video_label = QLabel()
+            frame = self.frames_by_src[src_ip]
+            frame_rgb = client.cv2.cvtColor(frame, client.cv2.COLOR_BGR2RGB)
+            h, w, ch = frame_rgb.shape
+            qt_image = client.QImage(frame_rgb.data, w, h, ch * w, client.QImage.Format_RGB888)
+            video_label.setPixmap(client.QPixmap.fromImage(qt_image).scaled(
+                width, height - label_height, client.Qt.KeepAspectRatio, client.Qt.SmoothTransformation))
+            tile_layout.addWidget(video_label)
+            self.video_layout.addWidget(tile)
+
+
+def run(app, sources, ticks, redraw_name):
+    host = TileHost()
+    rng = np.random.default_rng(0)
+    palette = [rng.integers(0, 255, (240, 320, 3), dtype=np.uint8) for _ in range(8)]
+    srcs = [f"10.0.1.{i}" for i in range(sources)]
+    redraw = getattr(host, redraw_name)
+    due = 0.0
+
+    times = []
+    render_time = rendered = 0
+    for tick in range(ticks):
+        # Deliver the frames that would have been decoded since the last tick
+        due += SOURCE_FPS / TICK_HZ
+        while due >= 1:
+            due -= 1
+            for i, src in enumerate(srcs):
+                start = time.perf_counter()
+                host._set_video_frame(src, palette[(tick + i) % len(palette)].copy())
+                render_time += time.perf_counter() - start
+                rendered += 1
+        start = time.perf_counter()
+        redraw()
+        app.processEvents()
+        times.append(time.perf_counter() - start)
+    times = sorted(times[5:])
+    return sum(times) / len(times), times[int(len(times) * 0.95)], render_time / rendered
+
+
+def main():
+    args = sys.argv[1:]
+    ticks = 150
+    if "--ticks" in args:
+        i = args.index("--ticks")
+        ticks = int(args[i + 1])
+        del args[i:i + 2]
+    counts = [int(a) for a in args] or [4, 9, 16]
+
+    app = QApplication(sys.argv[:1])
+    for sources in counts:
+        cells = []
+        for label, redraw_name in (("rebuild every tick", "legacy_redraw"), ("scale on GUI", "gui_scaled_redraw"),
+                                   ("blit pre-scaled", "_redraw_video")):
+            mean, p95, render = run(app, sources, ticks, redraw_name)
+            cells.append(f"{label} mean {mean * 1000:6.2f}ms p95 {p95 * 1000:6.2f}ms "
+                         f"({100 * mean * TICK_HZ:4.1f}% of GUI)")
+        print(f"{sources:2d} sources | " + " | ".join(cells) +
+              f" | decode-side render {render * 1000:5.2f}ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,24 @@ import os
 import io
 import sys
 import cv2
-import numpy as np
 from PIL import Image
 import queue as Queue
 import uuid
+import random
+import itertools
+import html
+from collections import deque
 
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QPropertyAnimation, QEasingCurve, QSize, QPoint, pyqtSlot, Q_ARG, QMetaObject
-from PyQt5.QtGui import QPixmap, QImage, QFont, QIcon, QPalette, QColor, QPainter, QPen, QBrush
+from PyQt5.QtGui import QPixmap, QImage, QFont, QIcon, QPalette, QColor, QPainter, QPen, QBrush, QTextCursor
 from PyQt5.QtWidgets import QAbstractItemView 
 
+from media import (CODEC_MASK, FLAG_KEYFRAME, FRAME_ID_MASK, INTER_FRAME_CODECS, LAYER_FULL, LAYER_HIGH, LAYER_LOW,
+                   SEND_OFFSET_UNIT, VIDEO_HEADER, FrameAssembler, Pacer, pack_video_chunks, stamp_send_offset)
+from video_codec import create_decoder, create_encoder
+from protocol import BINARY_CAPABILITY, ControlFramer, decode_frame, encode_control
+
 # Try to import mediapipe for gesture recognition
 try:
     import mediapipe as mp
@@ -57,6 +65,52 @@ VIDEO_HEIGHT = 240
 VIDEO_FPS = 20
 VIDEO_CHUNK = 1100
 JPEG_QUALITY = 80
+# Simulcast: also send a thumbnail layer; the server sends the high layer only for main tiles
+VIDEO_SIMULCAST = True
+VIDEO_LOW_WIDTH = 160
+VIDEO_LOW_HEIGHT = 120
+VIDEO_LOW_JPEG_QUALITY = 50
+# Adaptive sending: (jpeg quality, width, height, fps) from best to most degraded. The
+# encoder steps down on receiver-reported loss or slow decode and back up once reports
+# stay clean; edit the ladder to change the bounds.
+VIDEO_ADAPTIVE = True
+VIDEO_QUALITY_LADDER = [
+    (JPEG_QUALITY, VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS),
+    (65, 320, 240, 20),
+    (55, 320, 240, 15),
+    (50, 240, 180, 15),
+    (45, 240, 180, 12),
+    (40, 160, 120, 10),
+    (40, 160, 120, 8),
+]
+VIDEO_LOSS_DEGRADE = 0.05
+VIDEO_LOSS_RECOVER = 0.01
+VIDEO_RECOVER_REPORTS = 3  # consecutive clean evaluations before stepping back up
+VIDEO_DECODE_BUDGET = 0.5  # share of the frame interval a receiver may spend decoding
+# Static-scene skipping: frames whose 32x24 thumbnail differs from the last sent one by
+# less than this mean absolute difference (0-255) are not encoded, except for a refresh
+# every VIDEO_REFRESH_INTERVAL seconds so late joiners and lossy receivers catch up
+VIDEO_STATIC_THRESHOLD = 2.0
+VIDEO_REFRESH_INTERVAL = 1.0
+VIDEO_MOTION_SIZE = (32, 24)
+# One XOR parity packet per this many chunks (0 = off). Costs ~1/N extra upstream and fan-out bytes,
+# rounded up per frame (+23-34% at 4 for typical frames, see bench_fec.py), which also counts against
+# each receiver's budget; set to 4 on networks that lose packets
+VIDEO_FEC_GROUP = 0
+# Video codec: "jpeg" codes every frame on its own; "h264" (needs PyAV) sends most frames as
+# differences from the previous one, with a keyframe every VIDEO_KEYFRAME_INTERVAL frames and
+# whenever a receiver that lost part of the stream asks for one
+VIDEO_CODEC = "jpeg"
+VIDEO_KEYFRAME_INTERVAL = 60
+VIDEO_KEYFRAME_MIN_GAP = 0.5  # sender: seconds between forced keyframes per layer
+VIDEO_KEYFRAME_REQUEST_INTERVAL = 1.0  # receiver: seconds between keyframe requests per stream
+VIDEO_DECODE_QUEUE = 8  # inter-coded frames queued per stream before waiting for a keyframe instead
+# Pacing: spread each frame's packets over VIDEO_PACE_SPREAD of the frame interval instead of
+# sending them back to back, never faster than VIDEO_PACE_MAX_BITRATE
+VIDEO_PACING = True
+VIDEO_PACE_SPREAD = 0.8
+VIDEO_PACE_MAX_BITRATE = 20_000_000
+VIDEO_PACE_BURST = 4  # packets that may still go out back to back
 
 AUDIO_RATE = 16000
 AUDIO_CHANNELS = 1
@@ -64,6 +118,13 @@ AUDIO_FORMAT = pyaudio.paInt16 if PYAUDIO_AVAILABLE else None
 AUDIO_CHUNK = 256
 AUDIO_INPUT_CHUNK = 256
 MAX_UDP_SIZE = 65507
+HEARTBEAT_INTERVAL = 5.0
+MAX_VIDEO_TILES = 16
+VIDEO_FEEDBACK_INTERVAL = 1.0
+VIDEO_DECODE_WORKERS = 2
+VIDEO_SEND_QUEUE = 2  # encoded frames waiting for the socket
+VIDEO_PIPELINE_JOIN_TIMEOUT = 2.0  # wait for a stopped pipeline to let go of the camera
+VIDEO_STATS_INTERVAL = 10.0
 
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 450
@@ -138,11 +199,12 @@ def read_msg(sock):
         return None
 
 def pack_control(obj):
-    return (json.dumps(obj) + "\n").encode()
+    return encode_control(obj, control_binary)
 
 # ====== Global Sockets ======
 tcp_sock = None
 server_ip = None
+control_binary = False  # set once the server's welcome confirms BINARY_CAPABILITY
 
 video_send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 video_recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -578,6 +640,291 @@ def detect_gesture(self, frame):
     
     return None
 
+# ====== Video Send Pipeline ======
+class LatestFrameSlot:
+    """Single-frame handoff between pipeline stages: the writer overwrites,
+    readers take the newest frame they have not seen yet"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.item = None  # (seq, frame, captured_at)
+        self.seq = 0
+    
+    def put(self, frame, captured_at):
+        with self.lock:
+            self.seq += 1
+            self.item = (self.seq, frame, captured_at)
+    
+    def get_newer(self, seq):
+        with self.lock:
+            item = self.item
+        if item is None or item[0] <= seq:
+            return None
+        return item
+
+class VideoQualityController:
+    """Picks the sender's quality/resolution/fps step from receiver reports.
+    
+    Reports relayed by the server are kept per receiver; once per feedback
+    interval the median loss and worst decode time decide whether to step
+    down the ladder (immediately) or back up (after a run of clean reports).
+    """
+    
+    def __init__(self, ladder=None):
+        self.ladder = ladder or (VIDEO_QUALITY_LADDER if VIDEO_ADAPTIVE else VIDEO_QUALITY_LADDER[:1])
+        self.level = 0
+        self.reports = {}  # receiver -> (received at, loss, decode ms or None)
+        self.clean_streak = 0
+        self.last_eval = time.monotonic()
+    
+    def on_report(self, receiver, report):
+        expected = report.get("expected") or 0
+        loss = (report.get("lost") or 0) / expected if expected else 0.0
+        self.reports[receiver] = (time.monotonic(), loss, report.get("decode_ms"))
+    
+    def settings(self):
+        return self.ladder[self.level]
+    
+    def update(self, now):
+        if now - self.last_eval < VIDEO_FEEDBACK_INTERVAL:
+            return
+        self.last_eval = now
+        fresh = [r for r in list(self.reports.values()) if now - r[0] < 3 * VIDEO_FEEDBACK_INTERVAL]
+        if not fresh:
+            return
+        
+        losses = sorted(loss for _, loss, _ in fresh)
+        loss = losses[len(losses) // 2]
+        decode_ms = max((d for _, _, d in fresh if d is not None), default=0.0)
+        fps = self.ladder[self.level][3]
+        
+        level = self.level
+        if loss > VIDEO_LOSS_DEGRADE or decode_ms > VIDEO_DECODE_BUDGET * 1000.0 / fps:
+            level = min(level + 1, len(self.ladder) - 1)
+            self.clean_streak = 0
+        elif loss < VIDEO_LOSS_RECOVER:
+            self.clean_streak += 1
+            if self.clean_streak >= VIDEO_RECOVER_REPORTS:
+                level = max(level - 1, 0)
+                self.clean_streak = 0
+        else:
+            self.clean_streak = 0
+        
+        if level != self.level:
+            self.level = level
+            print(f"[DEBUG] Video quality -> {self.ladder[level]} (loss {loss:.3f}, decode {decode_ms:.1f}ms)")
+
+# ====== Video Decode Pool ======
+class VideoDecodePool:
+    """Decodes received video frames off the socket thread.
+    
+    Frames are queued per stream (source, simulcast layer), and a stream is
+    decoded by at most one worker at a time with its own decoder, which
+    keeps its frames in order. JPEG streams keep a single pending frame: a
+    newer one replaces one that has not started decoding yet, so a slow
+    decoder skips stale frames instead of queueing them. Inter-coded
+    streams can't skip, so their frames queue; after a missing frame, a
+    full queue or a failed decode the stream waits for its next keyframe
+    and on_keyframe_needed(src, layer) asks the sender for one.
+    """
+    
+    def __init__(self, on_frame, on_keyframe_needed=None, workers=VIDEO_DECODE_WORKERS):
+        self.on_frame = on_frame
+        self.on_keyframe_needed = on_keyframe_needed
+        self.cond = threading.Condition()
+        self.pending = {}  # (src, layer) -> deque of (codec id, frame bytes) not decoded yet
+        self.ready = set()  # streams with pending frames and no worker
+        self.last_served = {}  # (src, layer) -> number of the job that last decoded it
+        self.jobs = 0
+        self.busy = set()
+        self.decoders = {}  # (src, layer) -> (codec id, decoder), used by one worker at a time
+        self.last_ids = {}  # (src, layer) -> last inter-coded frame id queued
+        self.broken = set()  # inter-coded streams waiting for a keyframe
+        self.stats = {"submitted": 0, "decoded": 0, "skipped": 0, "failed": 0, "awaiting_keyframe": 0}
+        self.decode_times = {}  # src -> [frames decoded, seconds], cumulative
+        self.rate_mark = (time.time(), 0)
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"video-decode-{i}", daemon=True).start()
+    
+    def submit(self, src, frame_data, layer=LAYER_FULL, frame_id=0, flags=FLAG_KEYFRAME):
+        stream = (src, layer)
+        codec = flags & CODEC_MASK
+        need_keyframe = False
+        with self.cond:
+            self.stats["submitted"] += 1
+            frames = self.pending.get(stream)
+            if frames is None:
+                frames = self.pending[stream] = deque()
+            if codec not in INTER_FRAME_CODECS:
+                self.stats["skipped"] += len(frames)
+                frames.clear()
+            else:
+                last = self.last_ids.get(stream)
+                self.last_ids[stream] = frame_id
+                if flags & FLAG_KEYFRAME:
+                    self.broken.discard(stream)
+                elif last is None or frame_id != (last + 1) & FRAME_ID_MASK:
+                    self.broken.add(stream)
+                elif len(frames) >= VIDEO_DECODE_QUEUE:
+                    # Too far behind to catch up frame by frame
+                    self.broken.add(stream)
+                    self.stats["awaiting_keyframe"] += len(frames)
+                    frames.clear()
+                if stream in self.broken:
+                    self.stats["awaiting_keyframe"] += 1
+                    need_keyframe = True
+            if not need_keyframe:
+                frames.append((codec, frame_data))
+                if stream not in self.busy:
+                    self.ready.add(stream)
+                self.cond.notify()
+        if need_keyframe and self.on_keyframe_needed:
+            self.on_keyframe_needed(src, layer)
+    
+    def drop(self, src):
+        with self.cond:
+            for stream in [s for s in self.pending if s[0] == src]:
+                self.stats["skipped"] += len(self.pending.pop(stream))
+            for stream in [s for s in self.last_ids if s[0] == src]:
+                del self.last_ids[stream]
+                self.broken.discard(stream)
+            for stream in [s for s in self.decoders if s[0] == src]:
+                del self.decoders[stream]
+                self.last_served.pop(stream, None)
+            self.decode_times.pop(src, None)
+    
+    def _next_job(self):
+        # The stream that has waited longest since its last decode goes first, so under
+        # overload every source keeps getting frames decoded instead of the first few
+        while True:
+            while self.ready:
+                stream = min(self.ready, key=lambda s: self.last_served.get(s, -1))
+                self.ready.discard(stream)
+                frames = self.pending.get(stream)
+                if frames:
+                    self.busy.add(stream)
+                    self.last_served[stream] = self.jobs
+                    self.jobs += 1
+                    return stream, frames.popleft()
+            self.cond.wait()
+    
+    def _worker(self):
+        while True:
+            with self.cond:
+                stream, (codec, frame_data) = self._next_job()
+                codec_decoder = self.decoders.get(stream)
+                if codec_decoder is None or codec_decoder[0] != codec:
+                    codec_decoder = self.decoders[stream] = (codec, create_decoder(codec))
+            decoder = codec_decoder[1]
+            start = time.perf_counter()
+            try:
+                frame = decoder.decode(frame_data) if decoder is not None else None
+            except Exception:
+                frame = None
+            elapsed = time.perf_counter() - start
+            src, layer = stream
+            need_keyframe = False
+            with self.cond:
+                self.busy.discard(stream)
+                self.stats["decoded" if frame is not None else "failed"] += 1
+                if frame is not None and stream in self.pending:
+                    times = self.decode_times.setdefault(src, [0, 0.0])
+                    times[0] += 1
+                    times[1] += elapsed
+                elif codec in INTER_FRAME_CODECS and decoder is not None and stream not in self.broken:
+                    # Later deltas would build on a broken picture
+                    self.broken.add(stream)
+                    frames = self.pending.get(stream)
+                    if frames:
+                        self.stats["awaiting_keyframe"] += len(frames)
+                        frames.clear()
+                    need_keyframe = True
+                if self.pending.get(stream):
+                    self.ready.add(stream)
+                if self.ready:
+                    self.cond.notify()
+            if frame is not None:
+                self.on_frame(src, frame)
+            elif need_keyframe and self.on_keyframe_needed:
+                self.on_keyframe_needed(src, layer)
+    
+    def source_decode_times(self):
+        with self.cond:
+            return {src: tuple(times) for src, times in self.decode_times.items()}
+    
+    def snapshot(self):
+        """Counters plus frames decoded per second since the previous snapshot"""
+        with self.cond:
+            stats = dict(self.stats)
+        now = time.time()
+        then, decoded = self.rate_mark
+        self.rate_mark = (now, stats["decoded"])
+        stats["decode_fps"] = round((stats["decoded"] - decoded) / max(now - then, 1e-6), 1)
+        return stats
+
+# ====== Video Tile ======
+def render_video_frame(frame, size):
+    """Scale a BGR frame to fit size, keeping its aspect ratio, and convert it to RGB for QImage"""
+    width, height = size
+    frame_height, frame_width = frame.shape[:2]
+    scale = min(width / frame_width, height / frame_height)
+    scaled = (max(1, int(frame_width * scale)), max(1, int(frame_height * scale)))
+    if scaled != (frame_width, frame_height):
+        frame = cv2.resize(frame, scaled, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+class VideoTile(QFrame):
+    """One participant's video tile, kept alive for as long as the source is shown"""
+    
+    def __init__(self, src_ip, is_own_video=False):
+        super().__init__()
+        self.seq = None  # sequence number of the frame on screen
+        self.video_size = (0, 0)
+        
+        tile_layout = QVBoxLayout(self)
+        tile_layout.setContentsMargins(0, 0, 0, 0)
+        tile_layout.setSpacing(0)
+        
+        self.user_label = QLabel(f"👤 You ({src_ip})" if is_own_video else f"👤 {src_ip}")
+        self.user_label.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+        tile_layout.addWidget(self.user_label)
+        
+        self.video_label = QLabel()
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.video_label.setStyleSheet("background-color: black;")
+        tile_layout.addWidget(self.video_label)
+    
+    def configure(self, width, height, is_main, theme):
+        """Apply size and theme; the current frame is redrawn at the new size on the next tick"""
+        label_height = 32 if not is_main else 40
+        self.setFixedSize(width, height)
+        self.setStyleSheet(f"""
+            QFrame {{
+                background-color: {theme['panel']};
+                border: {'2px' if is_main else '1px'} solid {theme['border']};
+                border-radius: 12px;
+            }}
+        """)
+        self.user_label.setFixedHeight(label_height)
+        self.user_label.setFont(QFont("Inter", 10 if not is_main else 12, QFont.Bold))
+        self.user_label.setStyleSheet(f"""
+            background-color: {theme['border']};
+            color: {theme['text_primary']};
+            padding-left: 10px;
+            border-radius: 0px;
+            border-top-left-radius: 12px;
+            border-top-right-radius: 12px;
+        """)
+        self.video_size = (width, height - label_height)
+        self.seq = None
+    
+    def show_frame(self, seq, image):
+        """Blit an RGB frame from render_video_frame that already fits video_size"""
+        h, w, ch = image.shape
+        qt_image = QImage(image.data, w, h, ch * w, QImage.Format_RGB888)
+        self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+        self.seq = seq
+
 # ====== Conference Client ======
 class ConferenceClient(QMainWindow):
     log_signal = pyqtSignal(str, bool, bool)
@@ -587,6 +934,7 @@ class ConferenceClient(QMainWindow):
     gesture_signal = pyqtSignal(str, str)
     whiteboard_signal = pyqtSignal(dict)
     cursor_signal = pyqtSignal(str, int, int, str)
+    chat_history_signal = pyqtSignal(list, object, bool)
     
     def __init__(self):
         super().__init__()
@@ -605,9 +953,32 @@ class ConferenceClient(QMainWindow):
         self.screen_share_lock = threading.Lock()
         
         self.frames_by_src = {}
+        self.rendered_by_src = {}  # src -> (seq, size, RGB frame scaled to size) for the GUI to blit
+        self.video_frame_seq = itertools.count(1)
+        self.video_tile_sizes = {}  # src -> video area of its tile, for rendering off the GUI thread
         self.active_video_sources = {}
+        self.video_tiles = {}
+        self.video_layout_plan = None
+        self.no_video_label = None
+        self.video_assembler = FrameAssembler(chunk_size=VIDEO_CHUNK)
+        self.video_assembler_lock = threading.Lock()  # receiver thread adds, cleanup loop forgets
+        self.video_decoder = VideoDecodePool(self._set_video_frame, self._request_keyframe)
+        self.keyframe_requests_sent = {}  # (src, layer) -> when we last asked for a keyframe
+        self.keyframe_requests_received = set()  # our layers a receiver wants a keyframe on
+        self.video_rx_bytes = 0
+        self.video_send_stats = None
+        self.video_quality = VideoQualityController()
         self.video_timeout = 2.0
         self.active_users = []
+        self.roster = {}
+        self.roster_version = 0
+        self.roster_requested = False
+        self.control_framer = None
+        self.pending_control_frames = []
+        self.chat_history_cursor = None
+        self.chat_history_replayed = False
+        self.video_subscription = None
+        self.video_main_source = None
         self.selected_chat_user = None
         self.sidebar_visible = True
         self.screen_expanded = False
@@ -641,6 +1012,8 @@ class ConferenceClient(QMainWindow):
         
         self.running = True
         self.video_cap = None
+        self.video_stop = threading.Event()  # set to stop the current video pipeline
+        self.video_threads = []
         
         # Start TCP receiver thread FIRST (before UI)
         self.tcp_thread = threading.Thread(target=self.tcp_receiver_loop, daemon=True)
@@ -657,6 +1030,7 @@ class ConferenceClient(QMainWindow):
         self.gesture_signal.connect(self._show_gesture)
         self.whiteboard_signal.connect(self._handle_whiteboard_action)
         self.cursor_signal.connect(self._update_remote_cursor)
+        self.chat_history_signal.connect(self._handle_chat_history)
         
         # Start other background threads
         threading.Thread(target=self.video_receiver_loop, daemon=True).start()
@@ -668,6 +1042,11 @@ class ConferenceClient(QMainWindow):
         self.video_timer.timeout.connect(self._redraw_video)
         self.video_timer.start(66)
         
+        # Keeps the server's liveness reaper from dropping an idle session
+        self.heartbeat_timer = QTimer()
+        self.heartbeat_timer.timeout.connect(self.send_heartbeat)
+        self.heartbeat_timer.start(int(HEARTBEAT_INTERVAL * 1000))
+        
         # self.cursor_timer = QTimer()
         # self.cursor_timer.timeout.connect(self._send_cursor_position)
         # self.cursor_timer.start(50)
@@ -940,6 +1319,13 @@ class ConferenceClient(QMainWindow):
         chat_type_layout.addWidget(self.chat_type_label)
         chat_type_layout.addStretch()
         
+        self.earlier_btn = QPushButton("Earlier")
+        self.earlier_btn.setFixedSize(70, 28)
+        self.earlier_btn.setFont(QFont("Inter", 10))
+        self.earlier_btn.setEnabled(False)
+        self.earlier_btn.clicked.connect(self.load_earlier_chat)
+        chat_type_layout.addWidget(self.earlier_btn)
+        
         switch_btn = QPushButton("Switch to Direct")
         switch_btn.setFixedSize(110, 28)
         switch_btn.setFont(QFont("Inter", 10))
@@ -1128,6 +1514,7 @@ class ConferenceClient(QMainWindow):
         parent_layout.addWidget(controls)
     
     def _apply_theme(self):
+        self.video_layout_plan = None  # restyle video tiles on the next tick
         style = f"""
             QMainWindow {{
                 background-color: {self.theme['bg']};
@@ -1287,6 +1674,28 @@ class ConferenceClient(QMainWindow):
         else:
             self.chat_area.append(text)
     
+    def load_earlier_chat(self):
+        """Ask the server for the page of group chat before the oldest one shown"""
+        if not tcp_sock or not self.connected or self.chat_history_cursor is None:
+            return
+        try:
+            tcp_sock.sendall(pack_control({"type": "chat_history", "before": self.chat_history_cursor}))
+        except Exception as e:
+            print(f"[DEBUG] chat_history request failed: {e}")
+    
+    def _handle_chat_history(self, messages, next_before, prepend):
+        lines = [f"{m.get('from')}: {m.get('message')}" for m in messages]
+        if prepend:
+            cursor = self.chat_area.textCursor()
+            cursor.movePosition(QTextCursor.Start)
+            # insertHtml parses markup; messages are plain text like the live append path
+            cursor.insertHtml("<br>".join(html.escape(line) for line in lines) + "<br>")
+        else:
+            for line in lines:
+                self.chat_area.append(line)
+        self.chat_history_cursor = next_before
+        self.earlier_btn.setEnabled(next_before is not None)
+    
     def _update_users_display(self):
         """Update the participants list display"""
         print(f"[DEBUG] _update_users_display called on thread: {threading.current_thread().name}")
@@ -1313,9 +1722,39 @@ class ConferenceClient(QMainWindow):
         # Force update
         self.users_list.viewport().update()
         self.users_list.repaint()
+        
+        self._update_video_subscription()
+    
+    def _update_video_subscription(self):
+        """Tell the server which video sources we render, when that set changes: those
+        on screen, then others with their camera on in roster order, as many as the
+        layout has tiles for"""
+        if not self.connected or not tcp_sock:
+            return
+        
+        if self.whiteboard_visible:
+            sources = []
+        else:
+            # Our own tile is drawn from the local capture, not the server echo
+            own = {self.roster.get(self.username, {}).get("addr"), self.local_ip}
+            shown = [src_ip for src_ip in list(self.frames_by_src) if src_ip not in own]
+            sending = [u["addr"] for u in self.roster.values()
+                       if u.get("video") and u.get("addr") and u["addr"] not in own]
+            slots = MAX_VIDEO_TILES - (1 if self.local_ip in self.frames_by_src else 0)
+            sources = sorted(list(dict.fromkeys(shown + sending))[:slots])
+        high = [self.video_main_source] if self.video_main_source in sources else []
+        
+        if (sources, high) == self.video_subscription:
+            return
+        try:
+            tcp_sock.sendall(pack_control({"type": "video_subscribe", "sources": sources, "high": high}))
+            self.video_subscription = (sources, high)
+            print(f"[DEBUG] Video subscription: {sources} (high: {high})")
+        except Exception as e:
+            print(f"[DEBUG] video_subscribe failed: {e}")
     
     def connect(self):
-        global tcp_sock, server_ip
+        global tcp_sock, server_ip, control_binary
         if self.connected:
             return
         
@@ -1347,14 +1786,16 @@ class ConferenceClient(QMainWindow):
                 "name": username,
                 "password": password,
                 "video_port": LOCAL_VIDEO_LISTEN_PORT,
-                "audio_port": LOCAL_AUDIO_LISTEN_PORT
+                "audio_port": LOCAL_AUDIO_LISTEN_PORT,
+                "caps": [BINARY_CAPABILITY]
             })
             temp_sock.sendall(hello_msg)
             
             print("[DEBUG] Waiting for server response...")
             
             # Read response directly (before handing to receiver thread)
-            buf = b""
+            framer = ControlFramer()
+            pending_frames = []
             authenticated = False
             start_time = time.time()
             
@@ -1366,15 +1807,11 @@ class ConferenceClient(QMainWindow):
                         break
                     
                     print(f"[DEBUG] Received {len(data)} bytes")
-                    buf += data
+                    frames = framer.feed(data)
                     
-                    while b"\n" in buf:
-                        line, buf = buf.split(b"\n", 1)
-                        if not line:
-                            continue
-                        
+                    for i, frame in enumerate(frames):
                         try:
-                            msg = json.loads(line.decode())
+                            msg = decode_frame(frame)
                             mtype = msg.get("type")
                             print(f"[DEBUG] Received message type: {mtype}")
                             
@@ -1384,6 +1821,10 @@ class ConferenceClient(QMainWindow):
                                 temp_sock.close()
                                 return
                             
+                            elif mtype == "welcome":
+                                control_binary = BINARY_CAPABILITY in msg.get("caps", [])
+                                print(f"[DEBUG] Server welcome, binary control: {control_binary}")
+                            
                             elif mtype == "whiteboard_sync":
                                 print("[DEBUG] Received whiteboard_sync - authentication successful!")
                                 authenticated = True
@@ -1396,23 +1837,17 @@ class ConferenceClient(QMainWindow):
                             
                             elif mtype == "user_list":
                                 print(f"[DEBUG] Received user_list")
-                                users = msg.get("users", [])
-                                self.active_users = [u.get("name") for u in users]
-                                self.update_users_signal.emit()
+                                self._apply_roster_snapshot(msg)
                                 authenticated = True
                             
-                            elif mtype == "join":
-                                print(f"[DEBUG] Received join notification")
-                                if msg.get("name") == username:
-                                    authenticated = True
-                            
                             # If we got whiteboard_sync or user_list, we're authenticated
                             if authenticated:
                                 print("[DEBUG] Breaking out of receive loop - authenticated")
+                                pending_frames = frames[i + 1:]
                                 break
                                 
-                        except json.JSONDecodeError as e:
-                            print(f"[DEBUG] JSON parse error: {e}")
+                        except ValueError as e:
+                            print(f"[DEBUG] Control frame parse error: {e}")
                             continue
                     
                     if authenticated:
@@ -1433,6 +1868,9 @@ class ConferenceClient(QMainWindow):
             
             # Successfully authenticated - now hand socket to receiver thread
             print("[DEBUG] Successfully authenticated, setting up connection")
+            # Frames that arrived with the handshake go to the receiver thread
+            self.control_framer = framer
+            self.pending_control_frames = pending_frames
             tcp_sock = temp_sock
             tcp_sock.settimeout(None)
             self.connected = True
@@ -1459,6 +1897,7 @@ class ConferenceClient(QMainWindow):
             self.password_entry.setEnabled(False)
             
             self.log(f"Connected as {username}", is_system=True)
+            self._update_video_subscription()
             
         except Exception as e:
             print(f"[DEBUG] Connection exception: {e}")
@@ -1491,10 +1930,12 @@ class ConferenceClient(QMainWindow):
             self.log("Left meeting", is_system=True)
     
     def cleanup_connection(self):
-        global tcp_sock, screen_share_sock, screen_view_sock
+        global tcp_sock, screen_share_sock, screen_view_sock, control_binary
         
         self.connected = False
+        control_binary = False
         self.sending_video = False
+        self.video_stop.set()
         self.sending_audio = False
         self.gesture_enabled = False
 
@@ -1554,8 +1995,17 @@ class ConferenceClient(QMainWindow):
         self._apply_theme()
         
         self.frames_by_src.clear()
+        self.rendered_by_src.clear()
         self.active_video_sources.clear()
         self.active_users = []
+        self.roster = {}
+        self.roster_version = 0
+        self.control_framer = None
+        self.chat_history_cursor = None
+        self.chat_history_replayed = False
+        self.video_subscription = None
+        self.video_main_source = None
+        self.earlier_btn.setEnabled(False)
         self.selected_chat_user = None
         self.update_users_signal.emit()
         
@@ -1585,12 +2035,24 @@ class ConferenceClient(QMainWindow):
             return
         
         if not self.sending_video:
+            # A pipeline that was just stopped may still hold the camera
+            for thread in self.video_threads:
+                thread.join(VIDEO_PIPELINE_JOIN_TIMEOUT)
+            if any(thread.is_alive() for thread in self.video_threads):
+                QMessageBox.critical(self, "Error", "Camera is still closing, try again")
+                return
             try:
                 self.video_cap = cv2.VideoCapture(0)
                 if not self.video_cap.isOpened():
                     QMessageBox.critical(self, "Error", "Could not open camera")
                     return
                 
+                # Ask the camera for the send size directly so the encoder can skip resizing
+                self.video_cap.set(cv2.CAP_PROP_FRAME_WIDTH, VIDEO_WIDTH)
+                self.video_cap.set(cv2.CAP_PROP_FRAME_HEIGHT, VIDEO_HEIGHT)
+                self.video_cap.set(cv2.CAP_PROP_FPS, VIDEO_FPS)
+                self.video_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                
                 self.sending_video = True
                 self.video_btn.setText("🎥\nStop Video")
                 self.video_btn.setStyleSheet(f"""
@@ -1600,20 +2062,29 @@ class ConferenceClient(QMainWindow):
                         border-radius: 12px;
                     }}
                 """)
-                threading.Thread(target=self.video_sender_loop, daemon=True).start()
+                self._start_video_pipeline()
+                self._send_video_state(True)
                 self.log("Video started", is_system=True)
                 
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Video error: {e}")
         else:
+            # The capture stage releases the camera when it sees this
+            self.video_stop.set()
             self.sending_video = False
-            if self.video_cap:
-                self.video_cap.release()
-                self.video_cap = None
             self.video_btn.setText("🎥\nStart Video")
             self.video_btn.setStyleSheet("")
+            self._send_video_state(False)
             self.log("Video stopped", is_system=True)
     
+    def _send_video_state(self, on):
+        """Tell the server our camera is on or off; the roster carries it to receivers"""
+        if self.connected and tcp_sock:
+            try:
+                tcp_sock.sendall(pack_control({"type": "video_state", "on": on}))
+            except Exception as e:
+                print(f"[DEBUG] video_state failed: {e}")
+    
     def toggle_audio(self):
         if not self.connected or not PYAUDIO_AVAILABLE:
             return
@@ -1908,6 +2379,15 @@ class ConferenceClient(QMainWindow):
             self.whiteboard_btn.setText("🎨\nWhiteboard")
             self.whiteboard_btn.setStyleSheet("")
             self.log("Whiteboard disabled", is_system=True)
+        
+        self._update_video_subscription()
+    
+    def send_heartbeat(self):
+        if self.connected and tcp_sock:
+            try:
+                tcp_sock.sendall(pack_control({"type": "heartbeat"}))
+            except Exception as e:
+                print(f"[DEBUG] Heartbeat send failed: {e}")
     
     def send_cursor_position_wb(self, x, y):
         """Send cursor position for whiteboard"""
@@ -2204,47 +2684,222 @@ class ConferenceClient(QMainWindow):
             self.screen_content.setPixmap(pixmap)
             self.screen_content.setText("")
     
-    def video_sender_loop(self):
-        while self.sending_video and self.connected:
-            try:
-                ret, frame = self.video_cap.read()
+    def _start_video_pipeline(self):
+        """capture -> latest-frame slot -> encoder (paced to VIDEO_FPS) -> send queue -> sender"""
+        self.video_slot = LatestFrameSlot()
+        self.video_quality = VideoQualityController()
+        self.video_send_queue = Queue.Queue(maxsize=VIDEO_SEND_QUEUE)
+        self.video_send_stats = {
+            "captured": 0, "encoded": 0, "sent": 0, "static_skipped": 0,
+            "no_new_frame": 0, "deadline_misses": 0, "send_queue_drops": 0, "keyframes": 0, "keyframes_forced": 0,
+            "capture_s": 0.0, "motion_s": 0.0, "resize_s": 0.0, "encode_s": 0.0, "send_s": 0.0, "pace_s": 0.0,
+            "latency_s": 0.0
+        }
+        # Each pipeline has its own stop event, so a stopped one can't be revived by the next start
+        stop = self.video_stop = threading.Event()
+        self.video_threads = [
+            threading.Thread(target=self.video_capture_loop, args=(self.video_cap, self.video_slot, stop), daemon=True),
+            threading.Thread(target=self.video_sender_loop, args=(self.video_slot, self.video_send_queue, stop),
+                             daemon=True),
+            threading.Thread(target=self.video_packet_sender_loop, args=(self.video_send_queue, stop), daemon=True),
+            threading.Thread(target=self.gesture_loop, args=(self.video_slot, stop), daemon=True)
+        ]
+        for thread in self.video_threads:
+            thread.start()
+    
+    def video_capture_loop(self, cap, slot, stop):
+        """Capture stage: read frames as fast as the camera delivers them"""
+        stats = self.video_send_stats
+        try:
+            while not stop.is_set() and self.connected:
+                start = time.perf_counter()
+                ret, frame = cap.read()
                 if not ret:
                     time.sleep(0.01)
                     continue
+                stats["capture_s"] += time.perf_counter() - start
+                stats["captured"] += 1
+                slot.put(frame, time.monotonic())
+        except Exception as e:
+            print(f"Video capture error: {e}")
+        finally:
+            cap.release()
+            if self.video_cap is cap:
+                self.video_cap = None
+    
+    def gesture_loop(self, slot, stop):
+        """Gesture detection on the newest captured frame, off the encode path"""
+        last_seq = 0
+        while not stop.is_set() and self.connected:
+            item = slot.get_newer(last_seq) if self.gesture_enabled else None
+            if item is None:
+                time.sleep(0.02)
+                continue
+            last_seq, frame, _ = item
+            gesture = self.detect_gesture(frame)
+            if gesture:
+                try:
+                    tcp_sock.sendall(pack_control({
+                        "type": "gesture",
+                        "gesture_type": gesture
+                    }))
+                    self.gesture_signal.emit(self.username, gesture)
+                except:
+                    pass
+    
+    def video_sender_loop(self, slot, send_queue, stop):
+        """Encode stage: on a fixed monotonic schedule, encode the newest frame and queue its packets"""
+        stats = self.video_send_stats
+        # Random start so receivers never mistake a restarted stream for late packets
+        frame_id = random.getrandbits(32)
+        last_seq = 0
+        next_due = time.monotonic()
+        last_thumb = None
+        last_sent_at = 0.0
+        last_settings = None
+        main_layer = LAYER_HIGH if VIDEO_SIMULCAST else LAYER_FULL
+        encoders = {main_layer: create_encoder(VIDEO_CODEC, VIDEO_KEYFRAME_INTERVAL)}
+        if VIDEO_SIMULCAST:
+            encoders[LAYER_LOW] = create_encoder(VIDEO_CODEC, VIDEO_KEYFRAME_INTERVAL)
+        last_keyframe = {layer: 0.0 for layer in encoders}
+        wanted_keyframes = set()
+        self.keyframe_requests_received.clear()
+        
+        while not stop.is_set() and self.connected:
+            try:
+                self.video_quality.update(time.monotonic())
+                quality, width, height, fps = self.video_quality.settings()
+                interval = 1.0 / fps
                 
-                if self.gesture_enabled:
-                    gesture = self.detect_gesture(frame)
-                    if gesture:
-                        try:
-                            tcp_sock.sendall(pack_control({
-                                "type": "gesture",
-                                "gesture_type": gesture
-                            }))
-                            self.gesture_signal.emit(self.username, gesture)
-                        except:
-                            pass
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_due += interval
+                if time.monotonic() - next_due > interval:
+                    # More than a frame behind: start the schedule over instead of bursting to catch up
+                    stats["deadline_misses"] += 1
+                    next_due = time.monotonic() + interval
+                
+                item = slot.get_newer(last_seq)
+                if item is None:
+                    stats["no_new_frame"] += 1
+                    continue
+                last_seq, frame, captured_at = item
                 
-                frame = cv2.resize(frame, (VIDEO_WIDTH, VIDEO_HEIGHT))
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
-                frame_data = buffer.tobytes()
+                # Keyframes receivers asked for, at most one per layer every VIDEO_KEYFRAME_MIN_GAP
+                while self.keyframe_requests_received:
+                    wanted_keyframes.add(self.keyframe_requests_received.pop())
+                now = time.monotonic()
+                force_keyframe = {layer for layer in wanted_keyframes
+                                  if layer in encoders and now - last_keyframe[layer] >= VIDEO_KEYFRAME_MIN_GAP}
                 
-                seq = 0
-                offset = 0
-                while offset < len(frame_data):
-                    chunk_size = min(VIDEO_CHUNK, len(frame_data) - offset)
-                    chunk = frame_data[offset:offset + chunk_size]
-                    header = struct.pack('!II', seq, len(frame_data))
-                    packet = header + chunk
-                    video_send_sock.sendto(packet, (server_ip, SERVER_VIDEO_UDP_PORT))
-                    seq += 1
-                    offset += chunk_size
+                # Skip frames that barely differ from the last one sent, unless a refresh or keyframe is due
+                start = time.perf_counter()
+                thumb = cv2.cvtColor(cv2.resize(frame, VIDEO_MOTION_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                static = (last_thumb is not None and
+                          not force_keyframe and
+                          (quality, width, height, fps) == last_settings and
+                          captured_at - last_sent_at < VIDEO_REFRESH_INTERVAL and
+                          cv2.absdiff(thumb, last_thumb).mean() < VIDEO_STATIC_THRESHOLD)
+                stats["motion_s"] += time.perf_counter() - start
+                if static:
+                    stats["static_skipped"] += 1
+                    continue
+                last_thumb = thumb
+                last_sent_at = captured_at
+                last_settings = (quality, width, height, fps)
                 
-                time.sleep(1.0 / VIDEO_FPS)
+                start = time.perf_counter()
+                if frame.shape[1] != width or frame.shape[0] != height:
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                self._set_video_frame(self.local_ip, frame)
+                encode_start = time.perf_counter()
+                stats["resize_s"] += encode_start - start
+                
+                packets = []
+                for layer, encoder in encoders.items():
+                    if layer == LAYER_LOW:
+                        layer_frame = cv2.resize(frame, (VIDEO_LOW_WIDTH, VIDEO_LOW_HEIGHT), interpolation=cv2.INTER_AREA)
+                        layer_quality = VIDEO_LOW_JPEG_QUALITY
+                    else:
+                        layer_frame, layer_quality = frame, quality
+                    forced = layer in force_keyframe
+                    data, keyframe = encoder.encode(layer_frame, layer_quality, fps, forced)
+                    if not data:
+                        continue
+                    if keyframe:
+                        last_keyframe[layer] = now
+                        stats["keyframes"] += 1
+                        if forced:
+                            stats["keyframes_forced"] += 1
+                        wanted_keyframes.discard(layer)
+                    flags = encoder.codec_id | (FLAG_KEYFRAME if keyframe else 0)
+                    packets += pack_video_chunks(data, frame_id, layer, VIDEO_CHUNK, VIDEO_FEC_GROUP, flags)
+                frame_id += 1
+                stats["encode_s"] += time.perf_counter() - encode_start
+                stats["encoded"] += 1
+                
+                try:
+                    send_queue.put_nowait((packets, captured_at, interval))
+                except Queue.Full:
+                    # Socket stage is behind: the oldest queued frame is the least useful
+                    try:
+                        send_queue.get_nowait()
+                    except Queue.Empty:
+                        pass
+                    send_queue.put_nowait((packets, captured_at, interval))
+                    stats["send_queue_drops"] += 1
                 
             except Exception as e:
                 print(f"Video sender error: {e}")
                 break
     
+    def video_packet_sender_loop(self, send_queue, stop):
+        """Send stage: write each queued frame's packets to the server, paced over the frame interval"""
+        stats = self.video_send_stats
+        pacer = Pacer(VIDEO_PACE_MAX_BITRATE / 8, VIDEO_PACE_BURST * (VIDEO_CHUNK + VIDEO_HEADER.size))
+        while not stop.is_set() and self.connected:
+            try:
+                packets, captured_at, interval = send_queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            if VIDEO_PACING:
+                frame_bytes = sum(len(p) for p in packets)
+                pacer.rate = min(VIDEO_PACE_MAX_BITRATE / 8, frame_bytes / (VIDEO_PACE_SPREAD * interval))
+            start = time.perf_counter()
+            paced = 0.0
+            first_sent = None
+            try:
+                for packet in packets:
+                    if VIDEO_PACING:
+                        paced += pacer.wait(len(packet))
+                    # Lets receivers tell our pacing apart from queueing on the way
+                    now = time.monotonic()
+                    if first_sent is None:
+                        first_sent = now
+                    stamp_send_offset(packet, now - first_sent)
+                    video_send_sock.sendto(packet, (server_ip, SERVER_VIDEO_UDP_PORT))
+            except Exception as e:
+                print(f"Video send error: {e}")
+                continue
+            stats["pace_s"] += paced
+            stats["send_s"] += time.perf_counter() - start - paced
+            stats["sent"] += 1
+            stats["latency_s"] += time.monotonic() - captured_at
+    
+    def video_send_report(self):
+        """Sender stage counters with mean per-frame stage times in ms"""
+        stats = dict(self.video_send_stats)
+        examined = stats["encoded"] + stats["static_skipped"]
+        for stage, frames in (("capture", stats["captured"]), ("motion", examined), ("resize", stats["encoded"]),
+                              ("encode", stats["encoded"]), ("send", stats["sent"]), ("pace", stats["sent"]),
+                              ("latency", stats["sent"])):
+            seconds = stats.pop(f"{stage}_s")
+            stats[f"{stage}_ms"] = round(1000 * seconds / frames, 2) if frames else None
+        stats["static_skip_ratio"] = round(stats["static_skipped"] / examined, 3) if examined else 0.0
+        stats["quality"] = self.video_quality.settings()
+        return stats
+    
     def audio_sender_loop(self):
         while self.sending_audio and self.connected:
             try:
@@ -2284,50 +2939,53 @@ class ConferenceClient(QMainWindow):
                 time.sleep(0.1)
     
     def video_receiver_loop(self):
-        frame_buffers = {}
+        assembler = self.video_assembler
+        header_end = 4 + VIDEO_HEADER.size
         
         while self.running:
             try:
                 data, addr = video_recv_sock.recvfrom(MAX_UDP_SIZE)
-                if len(data) < 12:
+                self.video_rx_bytes += len(data)
+                if len(data) < header_end:
                     continue
                 
-                src_ip_bytes = data[:4]
-                src_ip = socket.inet_ntoa(src_ip_bytes)
-                seq, total_size = struct.unpack('!II', data[4:12])
-                chunk = data[12:]
+                src_ip = socket.inet_ntoa(data[:4])
+                layer, flags, fec_group, frame_id, index, count, total_size, send_offset = \
+                    VIDEO_HEADER.unpack_from(data, 4)
                 
-                if src_ip not in frame_buffers:
-                    frame_buffers[src_ip] = {"data": b"", "total": total_size, "seq": 0}
-                
-                buf = frame_buffers[src_ip]
-                
-                if seq == 0:
-                    buf["data"] = b""
-                    buf["total"] = total_size
-                    buf["seq"] = 0
-                
-                if seq == buf["seq"]:
-                    buf["data"] += chunk
-                    buf["seq"] += 1
-                
-                if len(buf["data"]) >= buf["total"]:
-                    try:
-                        frame_data = buf["data"][:buf["total"]]
-                        nparr = np.frombuffer(frame_data, np.uint8)
-                        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                        
-                        if frame is not None:
-                            self.frames_by_src[src_ip] = frame
-                            self.active_video_sources[src_ip] = time.time()
-                    except:
-                        pass
-                    
-                    frame_buffers[src_ip] = {"data": b"", "total": 0, "seq": 0}
+                # Simulcast layers of one source are reassembled separately
+                with self.video_assembler_lock:
+                    frame_data = assembler.add((src_ip, layer), frame_id, index, count, total_size,
+                                               memoryview(data)[header_end:], fec_group,
+                                               send_offset * SEND_OFFSET_UNIT)
+                if frame_data is not None:
+                    self.video_decoder.submit(src_ip, frame_data, layer, frame_id, flags)
                     
             except Exception as e:
                 time.sleep(0.001)
     
+    def _set_video_frame(self, src_ip, frame):
+        """Store a new frame for a source, already scaled and converted for its tile.
+        Runs on decode workers and the video sender, so the GUI thread only blits."""
+        seq = next(self.video_frame_seq)
+        size = self.video_tile_sizes.get(src_ip)
+        self.frames_by_src[src_ip] = frame
+        self.rendered_by_src[src_ip] = (seq, size, render_video_frame(frame, size) if size else None)
+        self.active_video_sources[src_ip] = time.time()
+    
+    def _request_keyframe(self, src_ip, layer):
+        """Ask a source for a keyframe after losing part of its inter-coded stream"""
+        now = time.monotonic()
+        last = self.keyframe_requests_sent.get((src_ip, layer))
+        if last is not None and now - last < VIDEO_KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.keyframe_requests_sent[(src_ip, layer)] = now
+        if self.connected and tcp_sock:
+            try:
+                tcp_sock.sendall(pack_control({"type": "keyframe_request", "source": src_ip, "layer": layer}))
+            except:
+                pass
+    
     def audio_receiver_loop(self):
         if not PYAUDIO_AVAILABLE:
             return
@@ -2367,6 +3025,8 @@ class ConferenceClient(QMainWindow):
                 time.sleep(0.001)
     
     def video_cleanup_loop(self):
+        last_feedback = last_stats = time.time()
+        last_counts = None
         while self.running:
             try:
                 time.sleep(0.5)
@@ -2381,27 +3041,110 @@ class ConferenceClient(QMainWindow):
                     for src_ip in stale_sources:
                         self.active_video_sources.pop(src_ip, None)
                         self.frames_by_src.pop(src_ip, None)
+                        self.rendered_by_src.pop(src_ip, None)
+                        self.video_decoder.drop(src_ip)
+                        with self.video_assembler_lock:
+                            for key in [k for k in self.video_assembler.streams if k[0] == src_ip]:
+                                self.video_assembler.forget(key, drop_counters=True)
+                        for key in [k for k in list(self.keyframe_requests_sent) if k[0] == src_ip]:
+                            del self.keyframe_requests_sent[key]
+                
+                if current_time - last_feedback >= VIDEO_FEEDBACK_INTERVAL:
+                    last_feedback = current_time
+                    last_counts = self.send_video_feedback(last_counts)
+                
+                if self.connected and current_time - last_stats >= VIDEO_STATS_INTERVAL:
+                    last_stats = current_time
+                    print(f"[DEBUG] Video stats: {self.video_stats()}")
                         
             except Exception as e:
                 time.sleep(0.1)
     
+    def video_stats(self):
+        """Reassembly and decode counters, including decode rate and skipped stale frames"""
+        stats = self.video_decoder.snapshot()
+        stats.update(self.video_assembler.stats)
+        if self.video_send_stats is not None:
+            stats["sender"] = self.video_send_report()
+        return stats
+    
+    def send_video_feedback(self, last):
+        """Report loss, received bytes and arrival spread since the last report so the
+        server can size our video budget, plus per-source loss, completed frames and
+        decode time for the server to relay to each sender. Returns the counters to
+        diff against next time."""
+        stats = self.video_assembler.stats
+        counts = (stats["chunks_expected"], stats["chunks_lost"], self.video_rx_bytes,
+                  stats["arrival_spread"], stats["completed"])
+        streams = self.video_assembler.stream_stats()
+        decode_times = self.video_decoder.source_decode_times()
+        last_counts, last_streams, last_decode_times = last or ((0, 0, 0, 0.0, 0), {}, {})
+        expected, lost, rx_bytes, spread, completed = (now - before for now, before in zip(counts, last_counts))
+        
+        # Per source, summed over simulcast layers
+        per_source = {}
+        for (src_ip, layer), now in streams.items():
+            before = last_streams.get((src_ip, layer), (0, 0, 0))
+            if now[0] < before[0]:
+                # Counters started over after the source timed out and came back
+                before = (0, 0, 0)
+            totals = per_source.setdefault(src_ip, [0, 0, 0])
+            for i in range(3):
+                totals[i] += now[i] - before[i]
+        sources = []
+        for src_ip, (src_expected, src_lost, src_completed) in per_source.items():
+            if not src_expected:
+                continue
+            entry = {"source": src_ip, "expected": src_expected, "lost": src_lost, "completed": src_completed}
+            decoded, seconds = decode_times.get(src_ip, (0, 0.0))
+            last_decoded, last_seconds = last_decode_times.get(src_ip, (0, 0.0))
+            if decoded > last_decoded:
+                entry["decode_ms"] = round(1000 * (seconds - last_seconds) / (decoded - last_decoded), 2)
+            sources.append(entry)
+        
+        if self.connected and tcp_sock and (expected or rx_bytes):
+            try:
+                report = {"type": "video_feedback", "expected": expected, "lost": lost, "bytes": rx_bytes,
+                          "sources": sources}
+                if completed:
+                    report["delay_ms"] = round(1000 * spread / completed, 1)
+                tcp_sock.sendall(pack_control(report))
+            except Exception as e:
+                print(f"[DEBUG] video_feedback failed: {e}")
+        return counts, streams, decode_times
+    
     def _redraw_video(self):
-        for i in reversed(range(self.video_layout.count())):
-            widget = self.video_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-        
+        """Rearrange tiles only when the layout changes; otherwise repaint tiles with a new frame"""
         active_sources = list(self.frames_by_src.keys())
+        if len(active_sources) > MAX_VIDEO_TILES:
+            # A source we unsubscribed from keeps its last frame until it times out
+            own = [src_ip for src_ip in active_sources if src_ip == self.local_ip]
+            others = [src_ip for src_ip in active_sources if src_ip != self.local_ip]
+            active_sources = own + others[:MAX_VIDEO_TILES - len(own)]
+        
+        self.video_main_source = self._main_video_source(active_sources)
+        self._update_video_subscription()
+        
+        plan = self._video_layout_plan(active_sources)
+        if plan != self.video_layout_plan:
+            self._apply_video_layout(plan)
+        
+        for src_ip, tile in self.video_tiles.items():
+            rendered = self.rendered_by_src.get(src_ip)
+            if rendered is None or rendered[0] == tile.seq:
+                continue
+            seq, size, image = rendered
+            if size != tile.video_size:
+                # Rendered before the tile got its current size; later frames will match
+                frame = self.frames_by_src.get(src_ip)
+                if frame is None:
+                    continue
+                image = render_video_frame(frame, tile.video_size)
+            tile.show_frame(seq, image)
+    
+    def _video_layout_plan(self, active_sources):
+        """(source, width, height, is_main) for each tile, in display order"""
         num_videos = len(active_sources)
-        
-        if num_videos == 0:
-            label = QLabel("No video feeds")
-            label.setAlignment(Qt.AlignCenter)
-            label.setFont(QFont("Inter", 14))
-            label.setStyleSheet(f"color: {self.theme['text_secondary']};")
-            self.video_layout.addWidget(label)
-            return
-        
         own_video_ip = None
         other_videos = []
         
@@ -2411,82 +3154,60 @@ class ConferenceClient(QMainWindow):
             else:
                 other_videos.append(src_ip)
         
+        if num_videos == 0:
+            return ()
         if num_videos == 1:
-            self._create_video_tile(active_sources[0], 1050, 700, is_main=True)
-        elif num_videos == 2:
+            return ((active_sources[0], 1050, 700, True),)
+        if num_videos == 2:
             if own_video_ip and other_videos:
-                self._create_video_tile(other_videos[0], 850, 600, is_main=True)
-                self._create_video_tile(own_video_ip, 280, 210, is_main=False)
-            else:
-                for src_ip in active_sources:
-                    self._create_video_tile(src_ip, 500, 400)
-        elif num_videos == 3:
+                return ((other_videos[0], 850, 600, True), (own_video_ip, 280, 210, False))
+            return tuple((src_ip, 500, 400, False) for src_ip in active_sources)
+        if num_videos == 3:
             if own_video_ip and len(other_videos) >= 1:
-                self._create_video_tile(other_videos[0], 700, 500, is_main=True)
+                plan = [(other_videos[0], 700, 500, True)]
                 if len(other_videos) >= 2:
-                    self._create_video_tile(other_videos[1], 280, 210)
-                self._create_video_tile(own_video_ip, 280, 210)
-            else:
-                for src_ip in active_sources:
-                    self._create_video_tile(src_ip, 350, 280)
-        else:
-            for src_ip in active_sources:
-                is_own = (src_ip == own_video_ip)
-                self._create_video_tile(src_ip, 340, 280, is_own_video=is_own)
-    
-    def _create_video_tile(self, src_ip, width, height, is_main=False, is_own_video=False):
-        tile = QFrame()
-        tile.setFixedSize(width, height)
-        tile.setStyleSheet(f"""
-            QFrame {{
-                background-color: {self.theme['panel']};
-                border: {'2px' if is_main else '1px'} solid {self.theme['border']};
-                border-radius: 12px;
-            }}
-        """)
-        tile_layout = QVBoxLayout(tile)
-        tile_layout.setContentsMargins(0, 0, 0, 0)
-        tile_layout.setSpacing(0)
-        
-        label_text = f"👤 {src_ip}"
-        if is_own_video or src_ip == self.local_ip:
-            label_text = f"👤 You ({src_ip})"
-        
-        user_label = QLabel(label_text)
-        label_height = 32 if not is_main else 40
-        user_label.setFixedHeight(label_height)
-        user_label.setFont(QFont("Inter", 10 if not is_main else 12, QFont.Bold))
-        user_label.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-        user_label.setStyleSheet(f"""
-            background-color: {self.theme['border']};
-            color: {self.theme['text_primary']};
-            padding-left: 10px;
-            border-radius: 0px;
-            border-top-left-radius: 12px;
-            border-top-right-radius: 12px;
-        """)
-        tile_layout.addWidget(user_label)
-        
-        video_label = QLabel()
-        video_label.setAlignment(Qt.AlignCenter)
-        video_label.setStyleSheet("background-color: black;")
-        
-        frame = self.frames_by_src.get(src_ip)
-        if frame is not None:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qt_image).scaled(
-                width, 
-                height - label_height, 
-                Qt.KeepAspectRatio, 
-                Qt.SmoothTransformation
-            )
-            video_label.setPixmap(pixmap)
-        
-        tile_layout.addWidget(video_label)
-        self.video_layout.addWidget(tile)
+                    plan.append((other_videos[1], 280, 210, False))
+                plan.append((own_video_ip, 280, 210, False))
+                return tuple(plan)
+            return tuple((src_ip, 350, 280, False) for src_ip in active_sources)
+        return tuple((src_ip, 340, 280, False) for src_ip in active_sources)
+    
+    def _apply_video_layout(self, plan):
+        """Reuse, resize and reorder tiles for a new layout; only departed sources lose their widget"""
+        while self.video_layout.count():
+            self.video_layout.takeAt(0)
+        
+        wanted = {src_ip for src_ip, _, _, _ in plan}
+        for src_ip in [s for s in self.video_tiles if s not in wanted]:
+            self.video_tiles.pop(src_ip).deleteLater()
+        
+        if self.no_video_label is None:
+            self.no_video_label = QLabel("No video feeds", self.video_widget)
+            self.no_video_label.setAlignment(Qt.AlignCenter)
+            self.no_video_label.setFont(QFont("Inter", 14))
+        self.no_video_label.setStyleSheet(f"color: {self.theme['text_secondary']};")
+        self.no_video_label.setVisible(not plan)
+        if not plan:
+            self.video_layout.addWidget(self.no_video_label)
+        
+        for src_ip, width, height, is_main in plan:
+            tile = self.video_tiles.get(src_ip)
+            if tile is None:
+                tile = self.video_tiles[src_ip] = VideoTile(src_ip, src_ip == self.local_ip)
+            tile.configure(width, height, is_main, self.theme)
+            self.video_layout.addWidget(tile)
+        
+        self.video_tile_sizes = {src_ip: tile.video_size for src_ip, tile in self.video_tiles.items()}
+        self.video_layout_plan = plan
+    
+    def _main_video_source(self, active_sources):
+        """Source drawn as the large main tile by _redraw_video, if any"""
+        others = [src_ip for src_ip in active_sources if src_ip != self.local_ip]
+        if len(active_sources) == 1:
+            return active_sources[0]
+        if len(active_sources) in (2, 3) and len(others) < len(active_sources):
+            return others[0]
+        return None
     
     def tcp_receiver_loop(self):
         global tcp_sock
@@ -2498,34 +3219,19 @@ class ConferenceClient(QMainWindow):
                 time.sleep(0.2)
                 continue
             
-            buf = b""
+            framer = self.control_framer or ControlFramer()
+            self._handle_control_frames(self.pending_control_frames)
+            self.pending_control_frames = []
             while self.connected or tcp_sock:
                 try:
-                    data = tcp_sock.recv(4096)
+                    data = tcp_sock.recv(65536)
                     if not data:
                         print("[DEBUG] TCP connection closed by server")
                         QTimer.singleShot(0, self.cleanup_connection)
                         break
                     
-                    buf += data
-                    while b"\n" in buf:
-                        line, buf = buf.split(b"\n", 1)
-                        if not line:
-                            continue
-                        
-                        try:
-                            msg = json.loads(line.decode())
-                            mtype = msg.get('type', 'unknown')
-                            print(f"[DEBUG] Received message type: {mtype}")
-                            
-                            # IMPORTANT: Process message immediately on this thread
-                            # then use signals to update UI
-                            self._process_message(msg)
-                            
-                        except Exception as e:
-                            print(f"[DEBUG] JSON parse error: {e}")
-                            continue
-                            
+                    self._handle_control_frames(framer.feed(data))
+                    
                 except socket.timeout:
                     continue
                 except Exception as e:
@@ -2534,6 +3240,21 @@ class ConferenceClient(QMainWindow):
                         QTimer.singleShot(0, self.cleanup_connection)
                     break
 
+    def _handle_control_frames(self, frames):
+        for frame in frames:
+            try:
+                msg = decode_frame(frame)
+                mtype = msg.get('type', 'unknown')
+                print(f"[DEBUG] Received message type: {mtype}")
+                
+                # IMPORTANT: Process message immediately on this thread
+                # then use signals to update UI
+                self._process_message(msg)
+                
+            except Exception as e:
+                print(f"[DEBUG] Control frame error: {e}")
+                continue
+    
     def _process_message(self, msg):
         """Process message on receiver thread, use signals for UI updates"""
         mtype = msg.get("type")
@@ -2552,6 +3273,11 @@ class ConferenceClient(QMainWindow):
             text = msg.get("message")
             self.log_signal.emit(f"{frm}: {text}", False, False)
         
+        elif mtype == "chat_history":
+            # First page is the replay sent on join; later pages are older
+            self.chat_history_signal.emit(msg.get("messages", []), msg.get("next_before"), self.chat_history_replayed)
+            self.chat_history_replayed = True
+        
         elif mtype == "private_chat":
             frm = msg.get("from")
             text = msg.get("message")
@@ -2563,33 +3289,42 @@ class ConferenceClient(QMainWindow):
             self.log_signal.emit(f"🔒 You to {to}: {text}", False, True)
         
         elif mtype == "user_list":
-            print(f"[DEBUG] Processing user_list")
-            users = msg.get("users", [])
-            print(f"[DEBUG] Users received: {users}")
-            
-            # Update active_users list
-            self.active_users = [u.get("name") for u in users if u.get("name")]
-            print(f"[DEBUG] Active users now: {self.active_users}")
-            
-            # Trigger UI update
-            self.update_users_signal.emit()
+            print(f"[DEBUG] Processing user_list v{msg.get('version')}")
+            self._apply_roster_snapshot(msg)
             
             # Mark as connected
             if not self.connected and self.username and self.username in self.active_users:
                 print(f"[DEBUG] Setting connected=True")
                 self.connected = True
         
-        elif mtype == "join":
-            name = msg.get('name')
+        elif mtype == "user_joined":
+            user = msg.get("user", {})
+            name = user.get("name")
             self.log_signal.emit(f"→ {name} joined", True, False)
+            
+            if self._roster_delta_in_order(msg.get("version", 0)) and name:
+                self.roster[name] = user
+                self._roster_changed()
         
-        elif mtype == "leave":
+        elif mtype == "user_updated":
+            user = msg.get("user", {})
+            name = user.get("name")
+            if self._roster_delta_in_order(msg.get("version", 0)) and name:
+                self.roster[name] = user
+                self._roster_changed()
+        
+        elif mtype == "user_left":
             name = msg.get('name')
             addr = msg.get('addr')
             self.log_signal.emit(f"← {name} left", True, False)
             
+            if self._roster_delta_in_order(msg.get("version", 0)):
+                self.roster.pop(name, None)
+                self._roster_changed()
+            
             if addr:
                 self.frames_by_src.pop(addr, None)
+                self.rendered_by_src.pop(addr, None)
                 self.active_video_sources.pop(addr, None)
         
         elif mtype == "gesture":
@@ -2611,12 +3346,15 @@ class ConferenceClient(QMainWindow):
         elif mtype == "whiteboard_action":
             self.whiteboard_signal.emit(msg)
         
-        elif mtype == "cursor_move":
-            username = msg.get("from")
-            x = msg.get("x")
-            y = msg.get("y")
-            color = msg.get("color", "#4C88FF")
-            self.cursor_signal.emit(username, x, y, color)
+        elif mtype == "cursor_batch":
+            for cursor in msg.get("cursors", []):
+                username = cursor.get("from")
+                if username == self.username:
+                    continue
+                x = cursor.get("x")
+                y = cursor.get("y")
+                color = cursor.get("color", "#4C88FF")
+                self.cursor_signal.emit(username, x, y, color)
         
         elif mtype == "file_offer":
             frm = msg.get("from")
@@ -2640,6 +3378,16 @@ class ConferenceClient(QMainWindow):
             size_mb = size / (1024 * 1024)
             self.log_signal.emit(f"📁 {frm} shared: {fname} ({size_mb:.2f} MB)", True, False)
 
+        elif mtype == "video_report":
+            # A receiver's view of our video, relayed by the server
+            self.video_quality.on_report(msg.get("from"), msg)
+
+        elif mtype == "keyframe_request":
+            # A receiver lost part of one of our inter-coded layers; video_sender_loop picks this up
+            layer = msg.get("layer")
+            if isinstance(layer, int):
+                self.keyframe_requests_received.add(layer)
+
         elif mtype == "present_start":
             presenter = msg.get('from')
             self.log_signal.emit(f"🖥 {presenter} started presenting", True, False)
@@ -2661,6 +3409,34 @@ class ConferenceClient(QMainWindow):
             if self.screen_expanded:
                 QTimer.singleShot(0, self.toggle_screen_panel)
         
+    def _apply_roster_snapshot(self, msg):
+        """Replace the local roster with a full user_list snapshot"""
+        users = msg.get("users", [])
+        self.roster = {u.get("name"): u for u in users if u.get("name")}
+        self.roster_version = msg.get("version", 0)
+        self.roster_requested = False
+        self._roster_changed()
+    
+    def _roster_delta_in_order(self, version):
+        """Check a user_joined/user_updated/user_left version; ask for a snapshot on a gap"""
+        if version <= self.roster_version:
+            return False
+        if version != self.roster_version + 1:
+            print(f"[DEBUG] Roster gap: have v{self.roster_version}, got v{version}")
+            if not self.roster_requested:
+                self.roster_requested = True
+                try:
+                    tcp_sock.sendall(pack_control({"type": "roster_request"}))
+                except Exception as e:
+                    print(f"[DEBUG] roster_request failed: {e}")
+            return False
+        self.roster_version = version
+        return True
+    
+    def _roster_changed(self):
+        self.active_users = list(self.roster.keys())
+        self.update_users_signal.emit()
+    
     def _add_file_card(self, filename, size, from_user):
         """Add a file card to the files list - INTERNAL USE ONLY"""
         print(f"[FILE_DEBUG] _add_file_card START: {filename}")
@@ -0,0 +1,335 @@
+"""
+Lan Conference Media Packets
+
+Video frames are encoded (JPEG by default, see video_codec.py) and split
+into UDP chunks of at most VIDEO_CHUNK bytes. Every chunk starts with a
+header:
+
+    u8 layer | u8 flags | u8 fec group | u32 frame id | u16 chunk index | u16 chunk count | u32 frame size
+    | u16 send offset
+
+The send offset is stamped by the sender as the packet leaves, in units
+of 100 us since the frame's first packet left. Receivers subtract it
+from arrival times, so the spread they report measures queueing rather
+than the sender's own pacing.
+
+The low bits of flags hold the codec id and FLAG_KEYFRAME marks frames
+that decode without any earlier frame (every JPEG frame is one).
+
+The server prepends the sender's packed 4-byte IPv4 address when it
+forwards a chunk. A sender either streams one LAYER_FULL stream or, in
+simulcast mode, a LAYER_LOW thumbnail stream plus a LAYER_HIGH stream;
+the server picks which simulcast layer each receiver gets.
+
+Chunk i of a frame holds bytes [i * VIDEO_CHUNK, (i + 1) * VIDEO_CHUNK),
+so receivers can place chunks that arrive out of order.
+
+With a non-zero fec group size G, the sender also sends one XOR parity
+packet per G data chunks, using chunk index count + group number. Groups
+are interleaved (chunk i belongs to group i % groups) so that a short
+burst of loss hits different groups. A receiver that misses exactly one
+chunk of a group rebuilds it from the parity and the rest of the group,
+at a bandwidth cost of about 1/G.
+"""
+
+import struct
+import time
+from collections import OrderedDict
+
+VIDEO_HEADER = struct.Struct('!BBBIHHIH')
+VIDEO_CHUNK = 1100
+MAX_FRAME_SIZE = 2 * 1024 * 1024  # receivers refuse to reassemble anything bigger
+
+LAYER_FULL = 0
+LAYER_LOW = 1
+LAYER_HIGH = 2
+VIDEO_LAYERS = (LAYER_FULL, LAYER_LOW, LAYER_HIGH)
+
+CODEC_JPEG = 0
+CODEC_H264 = 1
+INTER_FRAME_CODECS = frozenset({CODEC_H264})
+CODEC_MASK = 0x0F
+FLAG_KEYFRAME = 0x80
+
+FRAME_ID_MASK = 0xFFFFFFFF
+
+SEND_OFFSET = struct.Struct('!H')
+SEND_OFFSET_POS = VIDEO_HEADER.size - SEND_OFFSET.size
+SEND_OFFSET_UNIT = 1e-4
+
+
+def xor_chunks(chunks, length):
+    """XOR byte strings together, each zero-padded at the end to length"""
+    acc = 0
+    for chunk in chunks:
+        acc ^= int.from_bytes(chunk, 'big') << (8 * (length - len(chunk)))
+    return acc.to_bytes(length, 'big')
+
+def fec_group_count(count, fec_group):
+    return -(-count // fec_group)
+
+def pack_video_chunks(frame_data, frame_id, layer=LAYER_FULL, chunk_size=VIDEO_CHUNK, fec_group=0,
+                      flags=CODEC_JPEG | FLAG_KEYFRAME):
+    """Split one encoded frame into ready-to-send UDP payloads, plus parity packets if fec_group > 0.
+    Packets are bytearrays so the send stage can stamp_send_offset() them."""
+    total = len(frame_data)
+    count = max(1, -(-total // chunk_size))
+    frame_id &= FRAME_ID_MASK
+    chunks = [frame_data[i * chunk_size:(i + 1) * chunk_size] for i in range(count)]
+    packets = [bytearray(VIDEO_HEADER.pack(layer, flags, fec_group, frame_id, index, count, total, 0)) + chunk
+               for index, chunk in enumerate(chunks)]
+
+    if fec_group:
+        groups = fec_group_count(count, fec_group)
+        for group in range(groups):
+            members = chunks[group::groups]
+            parity = xor_chunks(members, max(len(c) for c in members))
+            packets.append(bytearray(VIDEO_HEADER.pack(layer, flags, fec_group, frame_id, count + group, count, total, 0))
+                           + parity)
+    return packets
+
+def stamp_send_offset(packet, seconds):
+    """Record in a packet how long after its frame's first packet it is being sent"""
+    SEND_OFFSET.pack_into(packet, SEND_OFFSET_POS, min(0xFFFF, int(seconds / SEND_OFFSET_UNIT)))
+
+def frame_id_newer(a, b):
+    """True if frame id a comes after b, allowing for u32 wraparound"""
+    return a != b and ((a - b) & FRAME_ID_MASK) < 0x80000000
+
+
+# ===== Pacing =====
+class Pacer:
+    """Token bucket that spreads packet sends out in time.
+
+    wait(nbytes) spends nbytes and, once the bucket is in debt, sleeps until
+    it is paid back at `rate` bytes/s. Up to `burst` bytes go out back to
+    back, which also absorbs sleep overshoot so the average rate holds.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled = time.monotonic()
+
+    def wait(self, nbytes):
+        """Spend nbytes, sleeping first if the bucket is empty; returns seconds slept"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        self.tokens -= nbytes
+        if self.tokens >= 0:
+            return 0.0
+        delay = -self.tokens / self.rate
+        time.sleep(delay)
+        return delay
+
+
+# ===== Reassembly =====
+class _PartialFrame:
+    __slots__ = ("buf", "total", "count", "fec_group", "bitmap", "missing", "parity", "started", "delay_min",
+                 "delay_max", "counters")
+
+    def __init__(self, total, count, fec_group, now, delay, counters):
+        self.buf = bytearray(total)
+        self.total = total
+        self.count = count
+        self.fec_group = fec_group
+        self.bitmap = 0
+        self.missing = count
+        self.parity = {}  # group -> parity payload, until the group is complete
+        self.started = now
+        # Range of arrival time minus send offset over the frame's chunks
+        self.delay_min = self.delay_max = delay
+        self.counters = counters  # the stream's [chunks expected, chunks lost, frames completed]
+
+
+class FrameAssembler:
+    """Rebuilds chunked frames per stream key, tolerating loss and reordering.
+
+    Each in-flight frame gets a preallocated bytearray that chunks are
+    copied into by index, with an int bitmap tracking which chunks have
+    arrived. Up to `window` frames per stream are kept in flight; frames
+    older than `timeout` seconds, older than the last completed frame, or
+    pushed out of the window are dropped and counted. A group with one
+    missing chunk is rebuilt as soon as its parity packet is in.
+    """
+
+    RESTART_GAP = 64
+
+    def __init__(self, window=4, timeout=0.5, chunk_size=VIDEO_CHUNK):
+        self.window = window
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.partial = {}  # key -> OrderedDict(frame id -> _PartialFrame), oldest first
+        self.last_done = {}  # key -> id of the newest completed frame
+        self.last_sweep = 0.0
+        self.streams = {}  # key -> [chunks expected, chunks lost, frames completed], cumulative
+        self.stats = {
+            "completed": 0, "incomplete": 0, "late": 0, "duplicate": 0, "malformed": 0, "fec_recovered": 0,
+            # Data chunks of finished frames and how many of those never arrived; for loss feedback
+            "chunks_expected": 0, "chunks_lost": 0,
+            # Total over completed frames of the spread of (arrival - send offset) across their
+            # chunks: queueing that built up while the frame was in flight, net of sender pacing
+            "arrival_spread": 0.0
+        }
+
+    def add(self, key, frame_id, index, count, total, payload, fec_group=0, send_offset=0.0, now=None):
+        """Store one chunk; return the frame's bytearray once it is complete, else None"""
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_sweep >= self.timeout:
+            self.expire(now)
+
+        chunk_size = self.chunk_size
+        frames = self.partial.get(key)
+        frame = frames.get(frame_id) if frames else None
+        if frame is None:
+            # The header's frame size sizes the buffer, so it must agree with the chunk count
+            if total > MAX_FRAME_SIZE or not (count - 1) * chunk_size < total <= count * chunk_size:
+                self.stats["malformed"] += 1
+                return None
+        elif frame.count != count or frame.total != total or frame.fec_group != fec_group:
+            # Later chunks only have to agree with the first, which was checked
+            self.stats["malformed"] += 1
+            return None
+
+        is_parity = index >= count
+        offset = index * chunk_size
+        if is_parity:
+            if not fec_group or index - count >= fec_group_count(count, fec_group) or len(payload) > chunk_size:
+                self.stats["malformed"] += 1
+                return None
+        elif offset + len(payload) > total or (index < count - 1 and len(payload) != chunk_size):
+            self.stats["malformed"] += 1
+            return None
+
+        if frame is not None:
+            delay = now - send_offset
+            if delay < frame.delay_min:
+                frame.delay_min = delay
+            elif delay > frame.delay_max:
+                frame.delay_max = delay
+        else:
+            # First chunk seen of this frame; frames in flight are always newer than the last done
+            last = self.last_done.get(key)
+            if last is not None and not frame_id_newer(frame_id, last):
+                if is_parity and frame_id == last:
+                    # Parity for a frame that completed without it
+                    return None
+                if (last - frame_id) & FRAME_ID_MASK <= self.RESTART_GAP:
+                    self.stats["late"] += 1
+                    return None
+                # Far behind the last frame: the sender restarted its frame ids
+                self.forget(key)
+                frames = None
+
+            if frames is None:
+                frames = self.partial.get(key)
+                if frames is None:
+                    frames = self.partial[key] = OrderedDict()
+            if len(frames) >= self.window:
+                self._abandon(frames.popitem(last=False)[1])
+            counters = self.streams.get(key)
+            if counters is None:
+                counters = self.streams[key] = [0, 0, 0]
+            frame = frames[frame_id] = _PartialFrame(total, count, fec_group, now, now - send_offset, counters)
+
+        if is_parity:
+            group = index - count
+            if group in frame.parity:
+                self.stats["duplicate"] += 1
+                return None
+            frame.parity[group] = bytes(payload)
+        else:
+            bit = 1 << index
+            if frame.bitmap & bit:
+                self.stats["duplicate"] += 1
+                return None
+            frame.bitmap |= bit
+            frame.buf[offset:offset + len(payload)] = payload
+            frame.missing -= 1
+            group = index % fec_group_count(count, fec_group) if fec_group else None
+
+        if frame.missing:
+            if group is not None and group in frame.parity:
+                self._recover(frame, group)
+            if frame.missing:
+                return None
+
+        # Complete: anything still in flight for this stream is older and can't be shown any more
+        del frames[frame_id]
+        for stale_id in [fid for fid in frames if not frame_id_newer(fid, frame_id)]:
+            self._abandon(frames.pop(stale_id))
+        self.last_done[key] = frame_id
+        stats = self.stats
+        stats["completed"] += 1
+        stats["chunks_expected"] += frame.count
+        stats["arrival_spread"] += frame.delay_max - frame.delay_min
+        counters = frame.counters
+        counters[0] += frame.count
+        counters[2] += 1
+        return frame.buf
+
+    def _abandon(self, frame):
+        stats = self.stats
+        stats["incomplete"] += 1
+        stats["chunks_expected"] += frame.count
+        stats["chunks_lost"] += frame.missing
+        frame.counters[0] += frame.count
+        frame.counters[1] += frame.missing
+
+    def _recover(self, frame, group):
+        """Rebuild the one missing chunk of a group from its parity, if exactly one is missing"""
+        chunk_size = self.chunk_size
+        total = len(frame.buf)
+        members = range(group, frame.count, fec_group_count(frame.count, frame.fec_group))
+        mask = 0
+        for i in members:
+            mask |= 1 << i
+        missing = mask & ~frame.bitmap
+        if missing == 0:
+            del frame.parity[group]
+            return
+        if missing & (missing - 1):
+            return
+
+        lost = missing.bit_length() - 1
+        parity = frame.parity.pop(group)
+        buf = frame.buf
+        present = [buf[i * chunk_size:min((i + 1) * chunk_size, total)] for i in members if i != lost]
+        offset = lost * chunk_size
+        length = min(chunk_size, total - offset)
+        buf[offset:offset + length] = xor_chunks(present + [parity], len(parity))[:length]
+        frame.bitmap |= missing
+        frame.missing -= 1
+        self.stats["fec_recovered"] += 1
+        self.stats["chunks_lost"] += 1
+        frame.counters[1] += 1
+
+    def expire(self, now=None):
+        """Drop in-flight frames that have waited longer than the timeout"""
+        if now is None:
+            now = time.monotonic()
+        self.last_sweep = now
+        for key, frames in list(self.partial.items()):
+            while frames:
+                frame_id, frame = next(iter(frames.items()))
+                if now - frame.started < self.timeout:
+                    break
+                self._abandon(frames.pop(frame_id))
+            if not frames:
+                del self.partial[key]
+
+    def stream_stats(self):
+        """Cumulative (chunks expected, chunks lost, frames completed) per stream key"""
+        return {key: tuple(counters) for key, counters in list(self.streams.items())}
+
+    def forget(self, key, drop_counters=False):
+        """Drop all state for a stream that went away, and with drop_counters its
+        stream_stats() entry too"""
+        for frame in self.partial.pop(key, {}).values():
+            self._abandon(frame)
+        self.last_done.pop(key, None)
+        if drop_counters:
+            self.streams.pop(key, None)
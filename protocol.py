@@ -0,0 +1,338 @@
+"""
+Lan Conference Control Protocol
+
+Control traffic is newline-delimited JSON. Peers that both advertise
+BINARY_CAPABILITY in the hello handshake may also send hot message types
+(cursor moves, whiteboard actions, gestures) as compact binary frames:
+
+    0x00 | u32 payload length | u8 type id | fields...
+
+Strings are u16-length-prefixed UTF-8 (0xFFFF means None) and integers are
+packed big-endian. A JSON line never starts with 0x00, so both kinds of
+frame can share one stream.
+"""
+
+import json
+import struct
+
+BINARY_CAPABILITY = "binary-v1"
+BINARY_MARKER = b"\x00"
+
+FRAME_HEADER = struct.Struct('!cI')
+U8 = struct.Struct('!B')
+U16 = struct.Struct('!H')
+I32 = struct.Struct('!i')
+I64 = struct.Struct('!q')
+F64 = struct.Struct('!d')
+POINT = struct.Struct('!ii')
+NONE_STR = 0xFFFF
+
+MSG_CURSOR_MOVE = 1
+MSG_CURSOR_BATCH = 2
+MSG_GESTURE = 3
+MSG_WHITEBOARD_ACTION = 4
+
+DATA_NONE = 0
+DATA_STROKE = 1
+DATA_SHAPE = 2
+DATA_JSON = 255
+
+STROKE_KEYS = {"id", "points", "color", "width", "timestamp"}
+SHAPE_KEYS = {"id", "type", "start", "end", "color", "width", "timestamp"}
+
+
+class CannotPack(Exception):
+    """Raised when a message does not fit the binary layout; callers fall back to JSON"""
+
+
+# ===== Field Packing =====
+def _pack_str(out, value):
+    if value is None:
+        out.append(U16.pack(NONE_STR))
+        return
+    if not isinstance(value, str):
+        raise CannotPack(f"expected str, got {type(value).__name__}")
+    raw = value.encode('utf-8')
+    if len(raw) >= NONE_STR:
+        raise CannotPack("string too long")
+    out.append(U16.pack(len(raw)))
+    out.append(raw)
+
+def _pack_int(out, value):
+    if not isinstance(value, int) or isinstance(value, bool) or not -2**31 <= value < 2**31:
+        raise CannotPack(f"expected int32, got {value!r}")
+    out.append(I32.pack(value))
+
+def _pack_number(out, value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise CannotPack(f"expected number, got {value!r}")
+    out.append(F64.pack(value))
+
+def _pack_point(out, point):
+    if not isinstance(point, dict) or point.keys() != {"x", "y"}:
+        raise CannotPack("expected {x, y} point")
+    _pack_int(out, point["x"])
+    _pack_int(out, point["y"])
+
+def _pack_points(out, points):
+    try:
+        coords = [v for p in points if len(p) == 2 for v in (p["x"], p["y"])]
+    except (KeyError, TypeError):
+        raise CannotPack("expected a list of {x, y} points")
+    if len(coords) != 2 * len(points) or not all(type(v) is int for v in coords):
+        raise CannotPack("expected a list of integer {x, y} points")
+    out.append(I32.pack(len(points)))
+    out.append(struct.pack(f'!{len(coords)}i', *coords))
+
+def _pack_whiteboard_data(out, data):
+    if data is None:
+        out.append(U8.pack(DATA_NONE))
+    elif isinstance(data, dict) and data.keys() == STROKE_KEYS:
+        out.append(U8.pack(DATA_STROKE))
+        _pack_str(out, data["id"])
+        _pack_str(out, data["color"])
+        _pack_int(out, data["width"])
+        _pack_number(out, data["timestamp"])
+        _pack_points(out, data["points"])
+    elif isinstance(data, dict) and data.keys() == SHAPE_KEYS:
+        out.append(U8.pack(DATA_SHAPE))
+        _pack_str(out, data["id"])
+        _pack_str(out, data["type"])
+        _pack_point(out, data["start"])
+        _pack_point(out, data["end"])
+        _pack_str(out, data["color"])
+        _pack_int(out, data["width"])
+        _pack_number(out, data["timestamp"])
+    else:
+        raw = json.dumps(data).encode('utf-8')
+        out.append(U8.pack(DATA_JSON))
+        out.append(I32.pack(len(raw)))
+        out.append(raw)
+
+
+class _Reader:
+    """Sequential field reader over a binary payload"""
+
+    def __init__(self, payload):
+        self.buf = bytes(payload)
+        self.pos = 0
+
+    def unpack(self, fmt):
+        value = fmt.unpack_from(self.buf, self.pos)
+        self.pos += fmt.size
+        return value
+
+    def u8(self):
+        return self.unpack(U8)[0]
+
+    def i32(self):
+        return self.unpack(I32)[0]
+
+    def f64(self):
+        return self.unpack(F64)[0]
+
+    def string(self):
+        length = U16.unpack_from(self.buf, self.pos)[0]
+        start = self.pos + U16.size
+        if length == NONE_STR:
+            self.pos = start
+            return None
+        self.pos = start + length
+        return self.buf[start:self.pos].decode('utf-8')
+
+    def point(self):
+        x, y = self.unpack(POINT)
+        return {"x": x, "y": y}
+
+    def points(self, count):
+        coords = struct.unpack_from(f'!{2 * count}i', self.buf, self.pos)
+        self.pos += 8 * count
+        return [{"x": x, "y": y} for x, y in zip(coords[::2], coords[1::2])]
+
+    def raw(self, length):
+        raw = self.buf[self.pos:self.pos + length]
+        self.pos += length
+        return raw
+
+
+def _read_whiteboard_data(r):
+    kind = r.u8()
+    if kind == DATA_NONE:
+        return None
+    if kind == DATA_STROKE:
+        data = {"id": r.string(), "color": r.string(), "width": r.i32(), "timestamp": r.f64()}
+        count = r.i32()
+        data["points"] = r.points(count)
+        return data
+    if kind == DATA_SHAPE:
+        return {
+            "id": r.string(),
+            "type": r.string(),
+            "start": r.point(),
+            "end": r.point(),
+            "color": r.string(),
+            "width": r.i32(),
+            "timestamp": r.f64()
+        }
+    if kind == DATA_JSON:
+        return json.loads(r.raw(r.i32()).decode('utf-8'))
+    raise ValueError(f"unknown whiteboard data kind {kind}")
+
+
+# ===== Message Encoding =====
+def _pack_cursor_move(out, msg):
+    _pack_int(out, msg.get("x"))
+    _pack_int(out, msg.get("y"))
+
+def _read_cursor_move(r):
+    return {"type": "cursor_move", "x": r.i32(), "y": r.i32()}
+
+def _pack_cursor_batch(out, msg):
+    cursors = msg.get("cursors", [])
+    out.append(U16.pack(len(cursors)))
+    for cursor in cursors:
+        _pack_str(out, cursor.get("from"))
+        _pack_int(out, cursor.get("x"))
+        _pack_int(out, cursor.get("y"))
+        _pack_str(out, cursor.get("color"))
+
+def _read_cursor_batch(r):
+    count = r.unpack(U16)[0]
+    cursors = []
+    for _ in range(count):
+        cursors.append({"from": r.string(), "x": r.i32(), "y": r.i32(), "color": r.string()})
+    return {"type": "cursor_batch", "cursors": cursors}
+
+def _pack_gesture(out, msg):
+    _pack_str(out, msg.get("from"))
+    _pack_str(out, msg.get("gesture_type"))
+
+def _read_gesture(r):
+    return {"type": "gesture", "from": r.string(), "gesture_type": r.string()}
+
+def _pack_whiteboard_action(out, msg):
+    version = msg.get("version")
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool) or version < 0):
+        raise CannotPack(f"expected non-negative version, got {version!r}")
+    _pack_str(out, msg.get("from"))
+    _pack_str(out, msg.get("action"))
+    out.append(I64.pack(-1 if version is None else version))
+    _pack_str(out, msg.get("erase_id"))
+    _pack_whiteboard_data(out, msg.get("data"))
+
+def _read_whiteboard_action(r):
+    msg = {"type": "whiteboard_action", "from": r.string(), "action": r.string()}
+    version = r.unpack(I64)[0]
+    msg["version"] = None if version < 0 else version
+    msg["erase_id"] = r.string()
+    msg["data"] = _read_whiteboard_data(r)
+    return msg
+
+# type name -> (type id, packer); type id -> reader
+BINARY_PACKERS = {
+    "cursor_move": (MSG_CURSOR_MOVE, _pack_cursor_move),
+    "cursor_batch": (MSG_CURSOR_BATCH, _pack_cursor_batch),
+    "gesture": (MSG_GESTURE, _pack_gesture),
+    "whiteboard_action": (MSG_WHITEBOARD_ACTION, _pack_whiteboard_action),
+}
+BINARY_READERS = {
+    MSG_CURSOR_MOVE: _read_cursor_move,
+    MSG_CURSOR_BATCH: _read_cursor_batch,
+    MSG_GESTURE: _read_gesture,
+    MSG_WHITEBOARD_ACTION: _read_whiteboard_action,
+}
+
+
+def encode_json(obj):
+    return (json.dumps(obj) + "\n").encode()
+
+def encode_binary(obj):
+    """Encode obj as a binary frame, or return None if its type has no binary form"""
+    entry = BINARY_PACKERS.get(obj.get("type"))
+    if entry is None:
+        return None
+    type_id, packer = entry
+    out = [U8.pack(type_id)]
+    try:
+        packer(out, obj)
+    except (CannotPack, struct.error):
+        return None
+    payload = b"".join(out)
+    return FRAME_HEADER.pack(BINARY_MARKER, len(payload)) + payload
+
+def encode_control(obj, binary=False):
+    """Encode obj for the wire, using the binary form when negotiated and available"""
+    if binary:
+        raw = encode_binary(obj)
+        if raw is not None:
+            return raw
+    return encode_json(obj)
+
+def decode_binary(payload):
+    r = _Reader(payload)
+    reader = BINARY_READERS.get(r.u8())
+    if reader is None:
+        raise ValueError("unknown binary message type")
+    return reader(r)
+
+def decode_frame(frame):
+    """Decode one frame yielded by ControlFramer (JSON line or binary payload)"""
+    is_binary, data = frame
+    if is_binary:
+        return decode_binary(data)
+    return json.loads(data.decode())
+
+
+# ===== Framing =====
+class ControlFramer:
+    """Incremental framer for a control stream of JSON lines and binary frames.
+
+    Received bytes are appended to one bytearray. Each feed() only scans the
+    newly arrived bytes for a newline, and the consumed prefix is trimmed
+    once it is more than half the buffer, so framing cost stays linear in
+    the bytes received.
+    """
+
+    COMPACT_MIN = 64 * 1024
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.start = 0
+        self.scan = 0
+
+    def feed(self, data):
+        """Append received bytes and return every complete frame as (is_binary, bytes)"""
+        buf = self.buf
+        buf += data
+        end = len(buf)
+        pos = self.start
+        frames = []
+
+        while pos < end:
+            if buf[pos] == 0:
+                if end - pos < FRAME_HEADER.size:
+                    break
+                _, length = FRAME_HEADER.unpack_from(buf, pos)
+                stop = pos + FRAME_HEADER.size + length
+                if stop > end:
+                    break
+                frames.append((True, bytes(buf[pos + FRAME_HEADER.size:stop])))
+                pos = stop
+            else:
+                newline = buf.find(b"\n", max(pos, self.scan))
+                if newline < 0:
+                    self.scan = end
+                    break
+                if newline > pos:
+                    frames.append((False, bytes(buf[pos:newline])))
+                pos = newline + 1
+
+        if pos == end:
+            buf.clear()
+            pos = self.scan = 0
+        elif pos >= self.COMPACT_MIN and pos * 2 >= end:
+            del buf[:pos]
+            self.scan = max(0, self.scan - pos)
+            pos = 0
+        self.start = pos
+        return frames
@@ -4,6 +4,8 @@ Lan Conference Server
 Password Generated in server Terminal.
 """
 
+import asyncio
+import queue
 import socket
 import threading
 import json
@@ -13,7 +15,12 @@ import time
 import logging
 import random
 import string
-from collections import defaultdict, deque
+import wave
+from collections import defaultdict, deque, namedtuple
+
+from media import (CODEC_H264, CODEC_JPEG, CODEC_MASK, FLAG_KEYFRAME, FRAME_ID_MASK, INTER_FRAME_CODECS, LAYER_HIGH,
+                   LAYER_LOW, VIDEO_HEADER, FrameAssembler, Pacer)
+from protocol import BINARY_CAPABILITY, ControlFramer, decode_frame, encode_binary, encode_control, encode_json
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -29,9 +36,50 @@ MAX_UDP_SIZE = 65507
 VIDEO_CHUNK_DATA = 1100
 AUDIO_BUFFER_SIZE = 10
 AUDIO_CHUNK_DURATION = 0.016
+CONTROL_BACKLOG = 256
+CLIENT_SEND_QUEUE_SIZE = 512
+CLOSE_FLUSH_TIMEOUT = 2.0
+CONTROL_COALESCE_WINDOW = 0
+# Messages a slow peer may lose when its send queue overflows
+DROPPABLE_MESSAGE_TYPES = {"cursor_move", "cursor_batch"}
+CURSOR_TICK_HZ = 30
+HEARTBEAT_TIMEOUT = 15.0
+CHAT_HISTORY_SIZE = 500
+CHAT_REPLAY_COUNT = 50
+CHAT_PAGE_SIZE = 100
+REAPER_TICK = 1.0
 
 SERVER_HOST = '0.0.0.0'
 
+# Video fan-out: one receive thread feeds VIDEO_FANOUT_WORKERS sender threads,
+# each owning a shard of the receivers and its own socket
+VIDEO_FANOUT_WORKERS = 4
+VIDEO_FANOUT_QUEUE = 256  # batches
+VIDEO_RECV_BATCH = 64
+VIDEO_RCVBUF = 4 * 1024 * 1024
+# Optional output pacing per fan-out worker (bits/s, 0 = send as fast as packets arrive)
+VIDEO_FORWARD_PACE_BITRATE = 0
+VIDEO_FORWARD_PACE_BURST = 16 * 1024  # bytes a worker may still send back to back
+# Per-receiver video budget, driven by video_feedback reports (bits/s)
+VIDEO_BUDGET_MAX = 20_000_000  # at or above this the receiver is not limited
+VIDEO_BUDGET_MIN = 200_000
+VIDEO_BUDGET_BURST = 0.25  # seconds of budget a receiver may bank
+VIDEO_LOSS_HIGH = 0.10
+VIDEO_LOSS_LOW = 0.02
+VIDEO_DELAY_OVERUSE_MS = 25.0
+VIDEO_PACKET_OVERHEAD = 4 + VIDEO_HEADER.size + 28  # source tag + header + UDP/IPv4
+# Subscription changes within this window share one routing rebuild
+VIDEO_ROUTES_PUBLISH_DELAY = 0.05
+STATS_LOG_INTERVAL = 30.0
+# Optional meeting recording into a timestamped folder under this directory (None = off):
+# per-source video (MJPEG, or raw H.264) plus per-source and mixed audio as WAV
+RECORDING_DIR = None
+RECORDING_QUEUE = 256  # forwarder batches / mixer ticks waiting for the writer, per kind
+RECORDING_BATCH = 64  # queue items written per pass
+RECORDING_BUFFER = 1 << 20  # bytes of write buffer per file
+RECORDING_FLUSH_INTERVAL = 2.0
+RECORDING_AUDIO_RATE = 16000
+
 # ===== Generate Server Password =====
 def generate_password():
     """Generate a 4-digit alphanumeric password"""
@@ -47,9 +95,29 @@ logger.info(f"{'='*50}")
 clients_lock = threading.Lock()
 clients = {}
 clients_by_name = {}
-
-udp_video_targets = set()
+control_loop = None
+
+# Roster version bumps on every join/leave; snapshot is rebuilt lazily
+roster_version = 0
+roster_snapshot = None
+
+# Recent group chat, fixed memory; ids are consecutive so a page is an index range
+chat_history = deque(maxlen=CHAT_HISTORY_SIZE)
+next_chat_id = 1
+
+# Whiteboard cursors: latest position per user, flushed once per cursor tick
+pending_cursors = {}
+last_sent_cursors = {}
+
+# Media routing: registries are mutated under clients_lock and published as
+# immutable MediaRoutes snapshots that the media threads read without locking
+MediaRoutes = namedtuple("MediaRoutes", ["video", "video_shards", "video_by_src", "audio", "audio_ips"])
+VideoSubscription = namedtuple("VideoSubscription", ["sources", "high"])
+udp_video_targets = {}  # (ip, port) -> VideoSubscription, or None for every source at full quality
+video_receivers = {}  # (ip, port) -> VideoReceiver
 udp_audio_targets = {}
+media_routes = MediaRoutes((), (((),) * VIDEO_FANOUT_WORKERS,) * 3, {}, (), frozenset())
+media_routes_pending = False  # a coalesced publish is scheduled on the control loop
 audio_queues = defaultdict(lambda: deque(maxlen=AUDIO_BUFFER_SIZE))
 
 screen_presenter = None
@@ -106,268 +174,687 @@ def read_msg(sock):
         return Nones
 
 # ===== TCP Helpers =====
+class ControlConnection:
+    """A control-channel peer served from the asyncio event loop.
+
+    Outgoing messages go through a bounded outbox drained by a per-peer
+    writer task, so a peer with a full TCP window only ever delays itself.
+    Messages queued within CONTROL_COALESCE_WINDOW leave in a single write.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.name = None
+        self.binary = False
+        self.info = None
+        self.outbox = deque()
+        self.outbox_ready = asyncio.Event()
+        self.closing = False
+        self.dropped = 0
+        self.writer_task = asyncio.get_running_loop().create_task(self.write_loop())
+
+    def send(self, raw, droppable=False):
+        if self.closing:
+            return
+
+        if len(self.outbox) >= CLIENT_SEND_QUEUE_SIZE and not self._drop_oldest_droppable():
+            if droppable:
+                self.dropped += 1
+                return
+            logger.warning(f"[TCP] Send queue overflow for {self.name or self.addr}, disconnecting")
+            self.outbox.clear()
+            self.abort()
+            return
+
+        self.outbox.append((raw, droppable))
+        self.outbox_ready.set()
+
+    def _drop_oldest_droppable(self):
+        for i, (_, droppable) in enumerate(self.outbox):
+            if droppable:
+                del self.outbox[i]
+                self.dropped += 1
+                return True
+        return False
+
+    async def write_loop(self):
+        try:
+            while not (self.closing and not self.outbox):
+                if not self.outbox:
+                    self.outbox_ready.clear()
+                    await self.outbox_ready.wait()
+                    # Let the rest of this burst queue up so it leaves in one write
+                    if not self.closing:
+                        await asyncio.sleep(CONTROL_COALESCE_WINDOW)
+                    continue
+                batch = b"".join(raw for raw, _ in self.outbox)
+                self.outbox.clear()
+                self.writer.write(batch)
+                await self.writer.drain()
+        except Exception as e:
+            logger.debug(f"Control writer error for {self.addr}: {e}")
+        finally:
+            self.writer.close()
+
+    def close(self):
+        """Flush whatever is already queued, then close the socket"""
+        if self.closing:
+            return
+        self.closing = True
+        self.outbox_ready.set()
+        asyncio.get_running_loop().call_later(CLOSE_FLUSH_TIMEOUT, self.abort)
+
+    def abort(self):
+        self.closing = True
+        self.writer_task.cancel()
+        self.writer.transport.abort()
+
+def call_in_control_loop(func, *args):
+    """Run func on the control event loop, hopping threads when called from elsewhere"""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+
+    if control_loop is None or running is control_loop:
+        func(*args)
+    else:
+        control_loop.call_soon_threadsafe(func, *args)
+
 def send_json(conn, obj):
     try:
-        raw = (json.dumps(obj) + "\n").encode()
-        conn.sendall(raw)
+        raw = encode_control(obj, conn.binary)
+        call_in_control_loop(conn.send, raw)
     except Exception as e:
         logger.debug(f"send_json error: {e}")
         pass
 
 def broadcast_json(obj, exclude_conn=None):
+    call_in_control_loop(_broadcast_json, obj, exclude_conn)
+
+def _broadcast_json(obj, exclude_conn=None):
+    raw_json = encode_json(obj)
+    raw_binary = None
+    droppable = obj.get("type") in DROPPABLE_MESSAGE_TYPES
+    dead = []
     with clients_lock:
         for c in list(clients.keys()):
+            if c is exclude_conn:
+                continue
             try:
-                if c is exclude_conn:
-                    continue
-                send_json(c, obj)
-            except:
-                cleanup_client(c)
-
-def get_user_list():
+                if c.binary:
+                    if raw_binary is None:
+                        raw_binary = encode_binary(obj) or raw_json
+                    c.send(raw_binary, droppable)
+                else:
+                    c.send(raw_json, droppable)
+            except Exception as e:
+                logger.debug(f"broadcast_json error: {e}")
+                dead.append(c)
+
+    for c in dead:
+        cleanup_client(c)
+
+def roster_entry(info):
+    return {
+        "name": info["name"],
+        "addr": f"{info['addr'][0]}",
+        "color": info.get("color", "#4C88FF"),
+        "video": info.get("video", False)
+    }
+
+def bump_roster():
+    """Invalidate the cached roster snapshot; call with clients_lock held"""
+    global roster_version, roster_snapshot
+    roster_version += 1
+    roster_snapshot = None
+    return roster_version
+
+def get_roster():
+    """Return (version, users), rebuilding the cached snapshot only after a change"""
+    global roster_snapshot
     with clients_lock:
-        user_list = []
-        for info in clients.values():
-            user_data = {
-                "name": info["name"],
-                "addr": f"{info['addr'][0]}",
-                "color": info.get("color", "#4C88FF")
-            }
-            user_list.append(user_data)
-            logger.info(f"[DEBUG] get_user_list: Adding user {user_data}")
-        
-        logger.info(f"[DEBUG] get_user_list returning {len(user_list)} users: {[u['name'] for u in user_list]}")
-        return user_list
+        if roster_snapshot is None:
+            roster_snapshot = [roster_entry(info) for info in clients.values()]
+        return roster_version, roster_snapshot
+
+def send_roster(conn):
+    version, users = get_roster()
+    send_json(conn, {"type": "user_list", "version": version, "users": users})
+
+def shard_targets(targets):
+    """Split targets across fan-out workers as (addr, VideoReceiver) pairs"""
+    shards = [[] for _ in range(VIDEO_FANOUT_WORKERS)]
+    for tgt in targets:
+        shards[hash(tgt) % VIDEO_FANOUT_WORKERS].append((tgt, video_receivers[tgt]))
+    return tuple(tuple(shard) for shard in shards)
+
+def layer_shards(receivers, high):
+    """Shards per video layer (full, low, high) for one source"""
+    high = set(high)
+    return (
+        shard_targets(receivers),
+        shard_targets(tgt for tgt in receivers if tgt not in high),
+        shard_targets(tgt for tgt in receivers if tgt in high)
+    )
+
+def publish_media_routes():
+    """Swap in a fresh routing snapshot; call with clients_lock held"""
+    global media_routes
+    unsubscribed = [tgt for tgt, subs in udp_video_targets.items() if subs is None]
+    targets = [(subs, hash(tgt) % VIDEO_FANOUT_WORKERS, (tgt, video_receivers[tgt]))
+               for tgt, subs in udp_video_targets.items()]
+
+    # Per known source: receivers that never subscribed plus those that asked for it.
+    # Unsubscribed receivers get the high simulcast layer, subscribers only if it is their main tile.
+    video_by_src = {}
+    for src_ip in {info["addr"][0] for info in clients.values()}:
+        try:
+            key = socket.inet_aton(src_ip)
+        except OSError:
+            continue
+        full, low, high = ([[] for _ in range(VIDEO_FANOUT_WORKERS)] for _ in range(3))
+        for subs, shard, target in targets:
+            if subs is None:
+                full[shard].append(target)
+                high[shard].append(target)
+                continue
+            if src_ip in subs.high:
+                high[shard].append(target)
+            if src_ip in subs.sources:
+                full[shard].append(target)
+                if src_ip not in subs.high:
+                    low[shard].append(target)
+        video_by_src[key] = tuple(tuple(tuple(shard) for shard in layer) for layer in (full, low, high))
+
+    media_routes = MediaRoutes(
+        video=tuple(udp_video_targets),
+        video_shards=layer_shards(unsubscribed, unsubscribed),
+        video_by_src=video_by_src,
+        audio=tuple((addr, name) for addr, (_, name) in udp_audio_targets.items()),
+        audio_ips=frozenset(ip for ip, _ in udp_audio_targets)
+    )
+
+def add_media_targets(conn, name, ip, vport, aport):
+    """Register a client's UDP receive ports; call with clients_lock held"""
+    if vport:
+        udp_video_targets[(ip, vport)] = None
+        video_receivers[(ip, vport)] = VideoReceiver(name)
+    if aport:
+        udp_audio_targets[(ip, aport)] = (conn, name)
+    publish_media_routes()
+
+def remove_media_targets(info):
+    """Drop a client's UDP receive ports; call with clients_lock held"""
+    ip = info["addr"][0]
+    if info.get("video_port"):
+        udp_video_targets.pop((ip, info["video_port"]), None)
+        video_receivers.pop((ip, info["video_port"]), None)
+    if info.get("audio_port"):
+        udp_audio_targets.pop((ip, info["audio_port"]), None)
+    publish_media_routes()
+
+def set_video_subscription(info, sources, high=()):
+    """Limit a client's video to the given source IPs (None = everything), with the
+    high simulcast layer for those in high; call with clients_lock held"""
+    tgt = (info["addr"][0], info.get("video_port"))
+    if tgt in udp_video_targets:
+        if sources is None:
+            udp_video_targets[tgt] = None
+        else:
+            udp_video_targets[tgt] = VideoSubscription(frozenset(sources), frozenset(high))
+        schedule_media_routes()
+
+def schedule_media_routes():
+    """Publish routes after VIDEO_ROUTES_PUBLISH_DELAY, once for every change made
+    in the meantime, so a burst of re-subscribes after a join costs one rebuild
+    instead of one per client; call with clients_lock held"""
+    global media_routes_pending
+    if control_loop is None:
+        publish_media_routes()
+    elif not media_routes_pending:
+        media_routes_pending = True
+        control_loop.call_soon_threadsafe(control_loop.call_later, VIDEO_ROUTES_PUBLISH_DELAY,
+                                          publish_scheduled_media_routes)
+
+def publish_scheduled_media_routes():
+    global media_routes_pending
+    with clients_lock:
+        media_routes_pending = False
+        publish_media_routes()
+
+def relay_video_reports(receiver_name, sources, senders):
+    """Forward a receiver's per-source video report to the client sending that source"""
+    if not isinstance(sources, list):
+        return
+    for entry in sources:
+        if not isinstance(entry, dict):
+            continue
+        relayed = {"type": "video_report", "from": receiver_name}
+        for key in ("expected", "lost", "completed", "decode_ms"):
+            if isinstance(entry.get(key), (int, float)):
+                relayed[key] = entry[key]
+        source = entry.get("source")
+        if not isinstance(source, str):
+            continue
+        for sender in senders.get(source, ()):
+            send_json(sender, relayed)
 
 def cleanup_client(conn, name_from_info=None):
     info = None
     name = name_from_info
     client_ip = None
 
+    liveness_wheel.cancel(conn)
+
     with clients_lock:
         info = clients.pop(conn, None)
         if info:
             name = info.get("name", "unknown")
             client_ip = info.get("addr", ["unknown"])[0]
             clients_by_name.pop(name, None)
+            version = bump_roster()
 
-        try:
-            if info.get("video_port"):
-                udp_video_targets.discard((info["addr"][0], info["video_port"]))
-            if info.get("audio_port"):
-                udp_audio_targets.pop((info["addr"][0], info["audio_port"]), None)
-        except Exception as e:
-            logger.debug(f"cleanup_client error: {e}")
-            pass
+            try:
+                remove_media_targets(info)
+            except Exception as e:
+                logger.debug(f"cleanup_client error: {e}")
+                pass
 
     if info:
         logger.info(f"[LEFT] {name} @ {info.get('addr')}")
-        user_list = get_user_list()
-        broadcast_json({"type": "user_list", "users": user_list})
-        broadcast_json({"type": "leave", "name": name, "addr": client_ip})
+        pending_cursors.pop(name, None)
+        last_sent_cursors.pop(name, None)
+        broadcast_json({"type": "user_left", "version": version, "name": name, "addr": client_ip})
     elif name_from_info:
-        logger.info(f"[LEFT] {name_from_info} (redundant cleanup)")
-        user_list = get_user_list()
-        broadcast_json({"type": "user_list", "users": user_list})
-        broadcast_json({"type": "leave", "name": name_from_info, "addr": None})
+        logger.debug(f"[LEFT] {name_from_info} (redundant cleanup)")
 
     try:
         conn.close()
     except:
         pass
 
+# ===== Chat History =====
+def record_chat(name, message):
+    global next_chat_id
+    entry = {"type": "chat", "id": next_chat_id, "from": name, "message": message, "ts": time.time()}
+    next_chat_id += 1
+    chat_history.append(entry)
+    return entry
+
+def chat_history_page(before=None, limit=CHAT_PAGE_SIZE):
+    """Return up to limit messages older than id `before` (newest page when None)"""
+    limit = max(1, min(int(limit), CHAT_PAGE_SIZE))
+    end = len(chat_history)
+    if chat_history and before is not None:
+        end = max(0, min(end, int(before) - chat_history[0]["id"]))
+    start = max(0, end - limit)
+    messages = [chat_history[i] for i in range(start, end)]
+    return {
+        "type": "chat_history",
+        "messages": messages,
+        "next_before": messages[0]["id"] if start > 0 else None
+    }
+
+# ===== Liveness =====
+class TimerWheel:
+    """Hashed timer wheel for session deadlines.
+
+    schedule() and cancel() are O(1); advance() only visits the slots that
+    came due, and every deadline is kept less than one rotation ahead, so
+    each visited entry has really expired.
+    """
+
+    def __init__(self, tick, horizon):
+        self.tick = tick
+        self.slots = [dict() for _ in range(int(horizon / tick) + 2)]
+        self.where = {}
+        self.current = int(time.monotonic() / tick)
+
+    def schedule(self, item, deadline):
+        index = max(int(deadline / self.tick) + 1, self.current + 1)
+        if self.where.get(item) == index:
+            return
+        self.cancel(item)
+        self.where[item] = index
+        self.slots[index % len(self.slots)][item] = index
+
+    def cancel(self, item):
+        index = self.where.pop(item, None)
+        if index is not None:
+            self.slots[index % len(self.slots)].pop(item, None)
+
+    def advance(self, now):
+        """Pop and return every item whose deadline is at or before now"""
+        expired = []
+        target = int(now / self.tick)
+        while self.current < target:
+            self.current += 1
+            slot = self.slots[self.current % len(self.slots)]
+            for item in [i for i, index in slot.items() if index <= self.current]:
+                del slot[item]
+                del self.where[item]
+                expired.append(item)
+        return expired
+
+liveness_wheel = TimerWheel(REAPER_TICK, HEARTBEAT_TIMEOUT)
+
+def touch_client(conn):
+    """Record traffic from a joined client and push back its liveness deadline"""
+    now = time.monotonic()
+    conn.info["last_seen"] = now
+    liveness_wheel.schedule(conn, now + HEARTBEAT_TIMEOUT)
+
+async def liveness_reaper():
+    while True:
+        await asyncio.sleep(REAPER_TICK)
+        for conn in liveness_wheel.advance(time.monotonic()):
+            logger.info(f"[REAP] {conn.name} @ {conn.addr} silent for {HEARTBEAT_TIMEOUT:.0f}s")
+            cleanup_client(conn)
+            conn.abort()
+
 # ===== TCP Control Handler =====
-def handle_control(conn, addr):
-    global user_color_index
-    name = None
+async def handle_control(reader, writer):
+    conn = ControlConnection(reader, writer)
     try:
-        buf = b""
+        framer = ControlFramer()
         while True:
-            data = conn.recv(4096)
+            data = await reader.read(65536)
             if not data:
                 break
 
-            buf += data
-            while b"\n" in buf:
-                line, buf = buf.split(b"\n", 1)
-                if not line:
-                    continue
+            if conn.info is not None:
+                touch_client(conn)
 
+            keep_open = True
+            for frame in framer.feed(data):
                 try:
-                    msg = json.loads(line.decode())
+                    msg = decode_frame(frame)
                 except Exception as e:
-                    logger.error(f"Bad JSON from {addr}: {e}")
+                    logger.error(f"Bad control frame from {conn.addr}: {e}")
                     continue
 
-                mtype = msg.get("type")
+                keep_open = handle_control_message(conn, msg)
+                if not keep_open:
+                    break
 
-                if mtype == "hello":
-                    # Check password first
-                    password = msg.get("password", "")
-                    if password != SERVER_PASSWORD:
-                        send_json(conn, {"type": "error", "message": "Invalid password", "auth_failed": True})
-                        logger.warning(f"[AUTH] Failed login attempt from {addr}")
-                        break
-                    
-                    name = msg.get("name", "anonymous")
-                    vport = int(msg.get("video_port", 0) or 0)
-                    aport = int(msg.get("audio_port", 0) or 0)
-
-                    with clients_lock:
-                        if name in clients_by_name:
-                            send_json(conn, {"type": "error", "message": "Username already taken"})
-                            name = None
-                            break
+            if not keep_open:
+                break
 
-                        # Assign color to user
-                        user_color = USER_COLORS[user_color_index % len(USER_COLORS)]
-                        user_color_index += 1
+    except Exception as e:
+        logger.debug(f"Control handler exception: {e}")
 
-                        clients[conn] = {
-                            "name": name,
-                            "addr": addr,
-                            "video_port": vport,
-                            "audio_port": aport,
-                            "last_seen": time.time(),
-                            "color": user_color
-                        }
-                        clients_by_name[name] = conn
+    finally:
+        cleanup_client(conn, conn.name)
 
-                        if vport:
-                            udp_video_targets.add((addr[0], vport))
-                        if aport:
-                            udp_audio_targets[(addr[0], aport)] = (conn, name)
+def handle_control_message(conn, msg):
+    """Dispatch one control message; returns False when the connection should close"""
+    global user_color_index
+    addr = conn.addr
+    name = conn.name
+    mtype = msg.get("type")
+
+    if mtype == "hello":
+        # Check password first
+        password = msg.get("password", "")
+        if password != SERVER_PASSWORD:
+            send_json(conn, {"type": "error", "message": "Invalid password", "auth_failed": True})
+            logger.warning(f"[AUTH] Failed login attempt from {addr}")
+            return False
+        
+        name = msg.get("name", "anonymous")
+        vport = int(msg.get("video_port", 0) or 0)
+        aport = int(msg.get("audio_port", 0) or 0)
+
+        with clients_lock:
+            if name in clients_by_name:
+                send_json(conn, {"type": "error", "message": "Username already taken"})
+                return False
+
+            # Assign color to user
+            user_color = USER_COLORS[user_color_index % len(USER_COLORS)]
+            user_color_index += 1
+
+            clients[conn] = {
+                "name": name,
+                "addr": addr,
+                "video_port": vport,
+                "audio_port": aport,
+                "last_seen": time.monotonic(),
+                "color": user_color
+            }
+            clients_by_name[name] = conn
+            conn.name = name
+            conn.info = clients[conn]
+            version = bump_roster()
+            user_entry = roster_entry(clients[conn])
+
+            add_media_targets(conn, name, addr[0], vport, aport)
+
+        # Binary encoding only once both sides advertise it
+        conn.binary = BINARY_CAPABILITY in (msg.get("caps") or [])
+        send_json(conn, {"type": "welcome", "caps": [BINARY_CAPABILITY] if conn.binary else []})
+
+        logger.info(f"[JOIN] {name} @ {addr} vport={vport} aport={aport} color={user_color}")
+        touch_client(conn)
+
+        # Send whiteboard state to new user
+        with whiteboard_lock:
+            send_json(conn, {
+                "type": "whiteboard_sync",
+                "state": whiteboard_state
+            })
 
-                    logger.info(f"[JOIN] {name} @ {addr} vport={vport} aport={aport} color={user_color}")
+        # Newcomer gets the full roster, everyone else only the delta
+        send_roster(conn)
+        send_json(conn, chat_history_page(limit=CHAT_REPLAY_COUNT))
+        broadcast_json({
+            "type": "user_joined",
+            "version": version,
+            "user": user_entry
+        }, exclude_conn=conn)
 
-                    # Send whiteboard state to new user
-                    with whiteboard_lock:
-                        send_json(conn, {
-                            "type": "whiteboard_sync",
-                            "state": whiteboard_state
-                        })
+    elif not name:
+        return False
 
-                    # Get and send user list
-                    user_list = get_user_list()
-                    logger.info(f"[DEBUG] Sending user list to {name}: {[u['name'] for u in user_list]}")
+    elif mtype == "roster_request":
+        send_roster(conn)
 
-                    # Send to new user
-                    send_json(conn, {"type": "user_list", "users": user_list})
+    elif mtype == "chat":
+        broadcast_json(record_chat(name, msg.get("message", "")))
 
-                    # Broadcast join to others
-                    broadcast_json({"type": "join", "name": name, "color": user_color}, exclude_conn=conn)
+    elif mtype == "chat_history":
+        try:
+            send_json(conn, chat_history_page(msg.get("before"), msg.get("limit", CHAT_PAGE_SIZE)))
+        except (TypeError, ValueError):
+            send_json(conn, {"type": "error", "message": "Bad chat_history request"})
+
+    elif mtype == "private_chat":
+        target_name = msg.get("to")
+        message = msg.get("message", "")
+        target_conn = None
+
+        with clients_lock:
+            target_conn = clients_by_name.get(target_name)
+
+        if target_conn:
+            send_json(target_conn, {
+                "type": "private_chat",
+                "from": name,
+                "message": message
+            })
+            send_json(conn, {
+                "type": "private_chat_sent",
+                "to": target_name,
+                "message": message
+            })
+        else:
+            send_json(conn, {
+                "type": "error",
+                "message": f"User {target_name} not found"
+            })
 
-                    # Broadcast updated user list to all (including new user this time)
-                    broadcast_json({"type": "user_list", "users": user_list})
+    elif mtype == "gesture":
+        # Broadcast gesture to all users
+        gesture_type = msg.get("gesture_type")
+        broadcast_json({
+            "type": "gesture",
+            "from": name,
+            "gesture_type": gesture_type
+        }, exclude_conn=conn)
+        logger.info(f"[GESTURE] {name} -> {gesture_type}")
+
+    elif mtype == "whiteboard_action":
+        # Handle whiteboard actions
+        action = msg.get("action")
+        
+        with whiteboard_lock:
+            if action == "draw":
+                whiteboard_state["strokes"].append(msg.get("data"))
+                whiteboard_state["version"] += 1
+            elif action == "shape":
+                whiteboard_state["shapes"].append(msg.get("data"))
+                whiteboard_state["version"] += 1
+            elif action == "text":
+                whiteboard_state["texts"].append(msg.get("data"))
+                whiteboard_state["version"] += 1
+            elif action == "erase":
+                erase_id = msg.get("erase_id")
+                whiteboard_state["strokes"] = [s for s in whiteboard_state["strokes"] if s.get("id") != erase_id]
+                whiteboard_state["shapes"] = [s for s in whiteboard_state["shapes"] if s.get("id") != erase_id]
+                whiteboard_state["texts"] = [t for t in whiteboard_state["texts"] if t.get("id") != erase_id]
+                whiteboard_state["version"] += 1
+            elif action == "clear":
+                whiteboard_state["strokes"] = []
+                whiteboard_state["shapes"] = []
+                whiteboard_state["texts"] = []
+                whiteboard_state["version"] += 1
+            elif action == "undo":
+                if whiteboard_state["strokes"]:
+                    whiteboard_state["strokes"].pop()
+                    whiteboard_state["version"] += 1
+                elif whiteboard_state["shapes"]:
+                    whiteboard_state["shapes"].pop()
+                    whiteboard_state["version"] += 1
+        
+        # Broadcast to all clients
+        broadcast_json({
+            "type": "whiteboard_action",
+            "from": name,
+            "action": action,
+            "data": msg.get("data"),
+            "erase_id": msg.get("erase_id"),
+            "version": whiteboard_state["version"]
+        }, exclude_conn=conn)
+
+    elif mtype == "cursor_move":
+        # Latest position wins; cursor_flusher batches them at CURSOR_TICK_HZ
+        with clients_lock:
+            info = clients.get(conn, {})
+        pending_cursors[name] = (msg.get("x"), msg.get("y"), info.get("color", "#4C88FF"))
+
+    elif mtype == "present_start":
+        broadcast_json({"type": "present_start", "from": name}, exclude_conn=conn)
+
+    elif mtype == "present_stop":
+        broadcast_json({"type": "present_stop", "from": name}, exclude_conn=conn)
+
+    elif mtype == "video_subscribe":
+        sources = msg.get("sources")
+        high = msg.get("high", [])
+        if (sources is not None and not (isinstance(sources, list) and all(isinstance(s, str) for s in sources))
+                or not (isinstance(high, list) and all(isinstance(s, str) for s in high))):
+            send_json(conn, {"type": "error", "message": "Bad video_subscribe request"})
+        else:
+            with clients_lock:
+                set_video_subscription(conn.info, sources, high)
 
-                elif not name:
-                    break
+    elif mtype == "video_state":
+        # Camera on or off; the roster tells receivers which sources to subscribe to
+        with clients_lock:
+            conn.info["video"] = bool(msg.get("on"))
+            version = bump_roster()
+            user_entry = roster_entry(conn.info)
+        broadcast_json({"type": "user_updated", "version": version, "user": user_entry})
 
-                elif mtype == "chat":
-                    broadcast_json({"type": "chat", "from": name, "message": msg.get("message", "")})
-
-                elif mtype == "private_chat":
-                    target_name = msg.get("to")
-                    message = msg.get("message", "")
-                    target_conn = None
-
-                    with clients_lock:
-                        target_conn = clients_by_name.get(target_name)
-
-                    if target_conn:
-                        send_json(target_conn, {
-                            "type": "private_chat",
-                            "from": name,
-                            "message": message
-                        })
-                        send_json(conn, {
-                            "type": "private_chat_sent",
-                            "to": target_name,
-                            "message": message
-                        })
-                    else:
-                        send_json(conn, {
-                            "type": "error",
-                            "message": f"User {target_name} not found"
-                        })
-
-                elif mtype == "gesture":
-                    # Broadcast gesture to all users
-                    gesture_type = msg.get("gesture_type")
-                    broadcast_json({
-                        "type": "gesture",
-                        "from": name,
-                        "gesture_type": gesture_type
-                    }, exclude_conn=conn)
-                    logger.info(f"[GESTURE] {name} -> {gesture_type}")
-
-                elif mtype == "whiteboard_action":
-                    # Handle whiteboard actions
-                    action = msg.get("action")
-                    
-                    with whiteboard_lock:
-                        if action == "draw":
-                            whiteboard_state["strokes"].append(msg.get("data"))
-                            whiteboard_state["version"] += 1
-                        elif action == "shape":
-                            whiteboard_state["shapes"].append(msg.get("data"))
-                            whiteboard_state["version"] += 1
-                        elif action == "text":
-                            whiteboard_state["texts"].append(msg.get("data"))
-                            whiteboard_state["version"] += 1
-                        elif action == "erase":
-                            erase_id = msg.get("erase_id")
-                            whiteboard_state["strokes"] = [s for s in whiteboard_state["strokes"] if s.get("id") != erase_id]
-                            whiteboard_state["shapes"] = [s for s in whiteboard_state["shapes"] if s.get("id") != erase_id]
-                            whiteboard_state["texts"] = [t for t in whiteboard_state["texts"] if t.get("id") != erase_id]
-                            whiteboard_state["version"] += 1
-                        elif action == "clear":
-                            whiteboard_state["strokes"] = []
-                            whiteboard_state["shapes"] = []
-                            whiteboard_state["texts"] = []
-                            whiteboard_state["version"] += 1
-                        elif action == "undo":
-                            if whiteboard_state["strokes"]:
-                                whiteboard_state["strokes"].pop()
-                                whiteboard_state["version"] += 1
-                            elif whiteboard_state["shapes"]:
-                                whiteboard_state["shapes"].pop()
-                                whiteboard_state["version"] += 1
-                    
-                    # Broadcast to all clients
-                    broadcast_json({
-                        "type": "whiteboard_action",
-                        "from": name,
-                        "action": action,
-                        "data": msg.get("data"),
-                        "erase_id": msg.get("erase_id"),
-                        "version": whiteboard_state["version"]
-                    }, exclude_conn=conn)
-
-                elif mtype == "cursor_move":
-                    # Broadcast cursor position to all users
-                    broadcast_json({
-                        "type": "cursor_move",
-                        "from": name,
-                        "x": msg.get("x"),
-                        "y": msg.get("y"),
-                        "color": clients[conn].get("color", "#4C88FF")
-                    }, exclude_conn=conn)
-
-                elif mtype == "present_start":
-                    broadcast_json({"type": "present_start", "from": name}, exclude_conn=conn)
-
-                elif mtype == "present_stop":
-                    broadcast_json({"type": "present_stop", "from": name}, exclude_conn=conn)
-
-                elif mtype == "bye":
-                    break
+    elif mtype == "video_feedback":
+        try:
+            report = {key: float(msg.get(key, 0)) for key in ("expected", "lost", "bytes")}
+            delay_ms = msg.get("delay_ms")
+            report["delay_ms"] = None if delay_ms is None else float(delay_ms)
+        except (TypeError, ValueError):
+            send_json(conn, {"type": "error", "message": "Bad video_feedback report"})
+        else:
+            with clients_lock:
+                rx = video_receivers.get((conn.info["addr"][0], conn.info.get("video_port")))
+                if rx:
+                    rx.on_feedback(report["expected"], report["lost"], report["bytes"], report["delay_ms"])
+                senders = defaultdict(list)
+                for other, info in clients.items():
+                    if other is not conn:
+                        senders[info["addr"][0]].append(other)
+            relay_video_reports(conn.info["name"], msg.get("sources"), senders)
+
+    elif mtype == "keyframe_request":
+        # A receiver lost part of an inter-coded stream; only its sender can repair it
+        source = msg.get("source")
+        layer = msg.get("layer")
+        if not isinstance(source, str) or not isinstance(layer, int):
+            send_json(conn, {"type": "error", "message": "Bad keyframe_request"})
+        else:
+            with clients_lock:
+                senders = [other for other, info in clients.items() if other is not conn and info["addr"][0] == source]
+            for sender in senders:
+                send_json(sender, {"type": "keyframe_request", "from": name, "layer": layer})
 
-    except Exception as e:
-        logger.debug(f"Control handler exception: {e}")
+    elif mtype == "heartbeat":
+        pass  # last_seen is refreshed for any traffic in handle_control
 
-    finally:
-        cleanup_client(conn, name)
+    elif mtype == "bye":
+        return False
+
+    return True
+
+def flush_cursors():
+    """Broadcast every cursor that moved since the last tick as one cursor_batch"""
+    batch = []
+    for name, pos in pending_cursors.items():
+        if last_sent_cursors.get(name) == pos:
+            continue
+        last_sent_cursors[name] = pos
+        x, y, color = pos
+        batch.append({"from": name, "x": x, "y": y, "color": color})
+    pending_cursors.clear()
+
+    if batch:
+        broadcast_json({"type": "cursor_batch", "cursors": batch})
+
+async def cursor_flusher():
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / CURSOR_TICK_HZ
+    deadline = loop.time()
+    while True:
+        deadline += interval
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+        try:
+            flush_cursors()
+        except Exception as e:
+            logger.error(f"[CURSOR] Flush error: {e}")
+
+async def control_server(host=SERVER_HOST, port=TCP_PORT):
+    """Serve every control connection from a single asyncio event loop"""
+    global control_loop
+    control_loop = asyncio.get_running_loop()
+
+    control_loop.create_task(cursor_flusher())
+    control_loop.create_task(liveness_reaper())
+    server = await asyncio.start_server(handle_control, host, port, backlog=CONTROL_BACKLOG)
+    logger.info(f"[TCP] Control server listening on {host}:{port}")
+
+    async with server:
+        await server.serve_forever()
 
 # ===== File Transfer Server =====
 def file_transfer_server():
@@ -460,40 +947,225 @@ def handle_file_transfer(conn, addr):
 
 # ===== Video Forwarder =====
 video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-video_sock.bind((SERVER_HOST, VIDEO_UDP_PORT))
+
+video_stats = {"received": 0, "malformed": 0, "errors": 0}
+video_workers = []
+
+class VideoReceiver:
+    """Bandwidth estimate and whole-frame admission for one video target.
+
+    on_feedback() runs on the control loop with the receiver's periodic
+    loss/delay report and moves the budget: multiplicative decrease toward
+    the measured receive rate on heavy loss or rising arrival spread
+    (queueing), gentle increase while loss stays low. admit() runs only on
+    the fan-out worker that owns this target and spends a token bucket one
+    frame at a time, so a receiver over budget loses whole frames, never
+    some of a frame's chunks. After dropping a frame of an inter-coded
+    stream it also drops that stream's following frames up to the next
+    keyframe, since the receiver could not decode them anyway.
+    """
+
+    MAX_TRACKED_FRAMES = 64
+
+    def __init__(self, name):
+        self.name = name
+        self.budget = None  # bits/s, None while unlimited
+        self.estimate = VIDEO_BUDGET_MAX
+        self.loss = 0.0
+        self.delay_ms = 0.0
+        self.base_delay_ms = None
+        self.rate = 0.0
+        self.last_report = time.monotonic()
+        # Worker-owned admission state
+        self.tokens = 0.0
+        self.refilled = time.monotonic()
+        self.frames = {}  # source tag + layer + frame id -> admitted
+        self.broken = set()  # source tag + layer of inter-coded streams waiting for a keyframe
+        self.frames_forwarded = 0
+        self.frames_dropped = 0
+
+    def on_feedback(self, expected, lost, received_bytes, delay_ms=None):
+        now = time.monotonic()
+        interval = max(0.1, now - self.last_report)
+        self.last_report = now
+        self.rate = received_bytes * 8 / interval
+        self.loss = lost / expected if expected > 0 else 0.0
+
+        # Baseline spread is the lowest seen, allowed to creep up slowly as conditions change
+        overuse = False
+        if delay_ms is not None:
+            self.delay_ms = delay_ms
+            if self.base_delay_ms is None or delay_ms < self.base_delay_ms:
+                self.base_delay_ms = delay_ms
+            else:
+                self.base_delay_ms += 0.5
+            overuse = delay_ms > self.base_delay_ms + VIDEO_DELAY_OVERUSE_MS
+
+        if self.loss > VIDEO_LOSS_HIGH or overuse:
+            self.estimate = max(VIDEO_BUDGET_MIN, min(self.estimate, self.rate) * 0.85)
+        elif self.loss < VIDEO_LOSS_LOW:
+            self.estimate = min(VIDEO_BUDGET_MAX, self.estimate * 1.08 + 50_000)
+        self.budget = None if self.estimate >= VIDEO_BUDGET_MAX else self.estimate
+
+    def admit(self, pkt, budget):
+        """Forward this packet? Decided once per frame from the first chunk seen"""
+        key = pkt[:5] + pkt[7:11]
+        admitted = self.frames.get(key)
+        if admitted is None:
+            _, flags, fec_group, _, _, count, total, _ = VIDEO_HEADER.unpack_from(pkt, 4)
+            parity = -(-count // fec_group) if fec_group else 0
+            cost = total + parity * VIDEO_CHUNK_DATA + (count + parity) * VIDEO_PACKET_OVERHEAD
+            stream = pkt[:5]
+            inter = (flags & CODEC_MASK) in INTER_FRAME_CODECS
+            if inter and flags & FLAG_KEYFRAME:
+                self.broken.discard(stream)
+
+            now = time.monotonic()
+            rate = budget / 8
+            self.tokens = min(max(rate * VIDEO_BUDGET_BURST, cost), self.tokens + (now - self.refilled) * rate)
+            self.refilled = now
+            admitted = self.tokens >= cost and stream not in self.broken
+            if admitted:
+                self.tokens -= cost
+                self.frames_forwarded += 1
+            else:
+                self.frames_dropped += 1
+                if inter:
+                    self.broken.add(stream)
+
+            self.frames[key] = admitted
+            if len(self.frames) > self.MAX_TRACKED_FRAMES:
+                del self.frames[next(iter(self.frames))]
+        return admitted
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "budget_kbps": None if self.budget is None else round(self.budget / 1000),
+            "rate_kbps": round(self.rate / 1000),
+            "loss": round(self.loss, 3),
+            "delay_ms": round(self.delay_ms, 1),
+            "frames_forwarded": self.frames_forwarded,
+            "frames_dropped": self.frames_dropped
+        }
+
+class VideoFanoutWorker:
+    """Sends forwarded video packets to one shard of the receivers"""
+
+    def __init__(self, index):
+        self.index = index
+        self.queue = queue.Queue(maxsize=VIDEO_FANOUT_QUEUE)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.stats = {"queue_drops": 0, "sent": 0, "send_errors": 0, "paced_s": 0.0}
+        self.pacer = None
+        if VIDEO_FORWARD_PACE_BITRATE:
+            self.pacer = Pacer(VIDEO_FORWARD_PACE_BITRATE / 8, VIDEO_FORWARD_PACE_BURST)
+
+    def submit(self, batch):
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            self.stats["queue_drops"] += len(batch)
+
+    def run(self):
+        sendto = self.sock.sendto
+        while True:
+            batch = self.queue.get()
+            routes = media_routes
+            pacer = self.pacer
+            sent = errors = 0
+            paced = 0.0
+            for pkt in batch:
+                # Packed source IP added by the receive stage, then the sender's layer byte
+                layers = routes.video_by_src.get(pkt[:4], routes.video_shards)
+                for tgt, rx in layers[pkt[4]][self.index]:
+                    budget = rx.budget
+                    if budget is not None and not rx.admit(pkt, budget):
+                        continue
+                    if pacer is not None:
+                        paced += pacer.wait(len(pkt))
+                    try:
+                        sendto(pkt, tgt)
+                        sent += 1
+                    except OSError:
+                        errors += 1
+            self.stats["sent"] += sent
+            self.stats["send_errors"] += errors
+            self.stats["paced_s"] += paced
+
+def kernel_udp_rcvbuf_errors():
+    """Host-wide UDP receive-buffer overflows (Linux only), or None"""
+    try:
+        with open("/proc/net/snmp") as f:
+            rows = [line.split() for line in f if line.startswith("Udp:")]
+        return int(rows[1][rows[0].index("RcvbufErrors")])
+    except Exception:
+        return None
+
+def get_video_stats():
+    """Per-stage video forwarding counters: receive, per-worker queue, send"""
+    stats = dict(video_stats)
+    stats["kernel_rcvbuf_errors"] = kernel_udp_rcvbuf_errors()
+    stats["workers"] = [dict(w.stats) for w in video_workers]
+    for key in ("queue_drops", "sent", "send_errors"):
+        stats[key] = sum(w[key] for w in stats["workers"])
+    return stats
+
+def get_receiver_stats():
+    """Per-receiver bandwidth estimate and frame admission counters"""
+    with clients_lock:
+        return {f"{ip}:{port}": rx.snapshot() for (ip, port), rx in video_receivers.items()}
 
 def video_forwarder():
-    logger.info(f"[VIDEO] Forwarder listening on UDP {VIDEO_UDP_PORT}")
+    """Receive stage: tag packets with their source IP and hand batches to every fan-out worker"""
+    logger.info(f"[VIDEO] Forwarder listening on UDP {VIDEO_UDP_PORT} with {VIDEO_FANOUT_WORKERS} fan-out workers")
+
+    try:
+        video_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, VIDEO_RCVBUF)
+    except OSError as e:
+        logger.debug(f"[VIDEO] Could not raise receive buffer: {e}")
+
+    for i in range(VIDEO_FANOUT_WORKERS):
+        worker = VideoFanoutWorker(i)
+        video_workers.append(worker)
+        threading.Thread(target=worker.run, daemon=True).start()
 
     while True:
         try:
+            # Block for one packet, then take whatever else is already queued
+            batch = []
             data, addr = video_sock.recvfrom(MAX_UDP_SIZE)
-            if len(data) < 8:
-                continue
-
-            try:
-                src_ip_packed = socket.inet_aton(addr[0])
-            except:
-                src_ip_packed = b'\x00\x00\x00\x00'
-
-            outpkt = src_ip_packed + data
-
-            with clients_lock:
-                targets = list(udp_video_targets)
+            while True:
+                if len(data) < VIDEO_HEADER.size or data[0] > LAYER_HIGH:
+                    video_stats["malformed"] += 1
+                else:
+                    try:
+                        src_ip_packed = socket.inet_aton(addr[0])
+                    except:
+                        src_ip_packed = b'\x00\x00\x00\x00'
+                    batch.append(src_ip_packed + data)
 
-            for tgt in targets:
+                if len(batch) >= VIDEO_RECV_BATCH:
+                    break
                 try:
-                    video_sock.sendto(outpkt, tgt)
-                except:
-                    pass
+                    data, addr = video_sock.recvfrom(MAX_UDP_SIZE, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+
+            video_stats["received"] += len(batch)
+            if batch:
+                for worker in video_workers:
+                    worker.submit(batch)
+                if recorder is not None:
+                    recorder.offer_video(batch)
 
         except Exception as e:
+            video_stats["errors"] += 1
             logger.error(f"[VIDEO] Forwarder error: {e}")
             pass
 
 # ===== Audio Receiver & Mixer =====
 audio_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-audio_sock.bind((SERVER_HOST, AUDIO_UDP_PORT))
 
 def audio_receiver():
     logger.info(f"[AUDIO] Receiver listening on UDP {AUDIO_UDP_PORT}")
@@ -520,9 +1192,8 @@ def audio_mixer():
             frames = []
             sources = []
 
-            with clients_lock:
-                current_audio_targets = set(udp_audio_targets.keys())
-            known_ips = {ip for (ip, port) in current_audio_targets}
+            routes = media_routes
+            known_ips = routes.audio_ips
 
             for addr in list(audio_queues.keys()):
                 q = audio_queues[addr]
@@ -551,16 +1222,18 @@ def audio_mixer():
             if not frames:
                 pass
             else:
-                arrays = [np.frombuffer(f, dtype=np.int16) for f in frames if len(f) > 0 and len(f) % 2 == 0]
+                # Filter sources with their frames so both lists stay index-aligned
+                usable = [(addr, f) for addr, f in zip(sources, frames) if len(f) > 0 and len(f) % 2 == 0]
+                sources = [addr for addr, _ in usable]
+                arrays = [np.frombuffer(f, dtype=np.int16) for _, f in usable]
 
                 if arrays:
                     minlen = min(a.shape[0] for a in arrays)
                     arrays = [a[:minlen] for a in arrays]
+                    if recorder is not None:
+                        recorder.offer_audio(sources, arrays)
 
-                    with clients_lock:
-                        targets = list(udp_audio_targets.items())
-
-                    for tgt_addr_tuple, (tgt_conn, tgt_name) in targets:
+                    for tgt_addr_tuple, tgt_name in routes.audio:
                         tgt_addr = (tgt_addr_tuple[0], tgt_addr_tuple[1])
 
                         tgt_arrays = []
@@ -750,30 +1423,220 @@ def broadcast_screen_frame(frame_data):
                 pass
             screen_viewers.pop(dead, None)
 
+# ===== Recording =====
+class MediaRecorder:
+    """Archives the meeting without slowing the media paths down.
+
+    The video forwarder and the audio mixer each hand over references to
+    what they already have (received packet batches, the tick's source
+    arrays) with offer_video() / offer_audio(): a length check and a deque
+    append, no locks, no copies. Each deque has one producer and the
+    writer as its only consumer. When a deque is full the item is dropped
+    and counted. The writer thread reassembles frames, mixes audio and
+    appends to the files in batches through large buffers.
+    """
+
+    EXTENSIONS = {CODEC_JPEG: "mjpeg", CODEC_H264: "h264"}
+
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.video_queue = deque()
+        self.audio_queue = deque()
+        self.running = True
+        self.files = {}  # file name -> (wave writer or None, file)
+        self.assembler = FrameAssembler()
+        self.last_ids = {}  # (source tag, codec) -> last inter-coded frame id written
+        self.stats = {
+            # Each counter has a single writing thread: forwarder, mixer or writer
+            "video_batches_dropped": 0, "video_packets_dropped": 0, "audio_ticks_dropped": 0,
+            "frames_written": 0, "frames_skipped": 0, "audio_ticks_written": 0,
+            "bytes_written": 0, "write_errors": 0, "errors": 0
+        }
+
+    def offer_video(self, batch):
+        """Called by the forwarder with each received batch of source-tagged packets"""
+        if len(self.video_queue) >= RECORDING_QUEUE:
+            self.stats["video_batches_dropped"] += 1
+            self.stats["video_packets_dropped"] += len(batch)
+            return
+        self.video_queue.append(batch)
+
+    def offer_audio(self, sources, arrays):
+        """Called by the mixer each tick with its source addresses and sample arrays"""
+        if len(self.audio_queue) >= RECORDING_QUEUE:
+            self.stats["audio_ticks_dropped"] += 1
+            return
+        self.audio_queue.append((sources, arrays))
+
+    def run(self):
+        import numpy as np
+        logger.info(f"[RECORD] Recording to {self.directory}")
+        last_flush = time.monotonic()
+        while self.running or self.video_queue or self.audio_queue:
+            video = [self.video_queue.popleft() for _ in range(min(len(self.video_queue), RECORDING_BATCH))]
+            audio = [self.audio_queue.popleft() for _ in range(min(len(self.audio_queue), RECORDING_BATCH))]
+
+            try:
+                parts = defaultdict(list)  # file name -> chunks to append this pass
+                for batch in video:
+                    self._add_video(batch, parts)
+                for sources, arrays in audio:
+                    for addr, samples in zip(sources, arrays):
+                        parts[f"audio_{addr[0]}.wav"].append(samples.tobytes())
+                    mixed = np.clip(np.mean(np.vstack(arrays), axis=0), -32768, 32767).astype(np.int16)
+                    parts["audio_mixed.wav"].append(mixed.tobytes())
+                    self.stats["audio_ticks_written"] += 1
+                self._write(parts)
+
+                now = time.monotonic()
+                if now - last_flush >= RECORDING_FLUSH_INTERVAL:
+                    last_flush = now
+                    self._flush()
+            except Exception as e:
+                # Lose this pass, not the recording
+                self.stats["errors"] += 1
+                logger.error(f"[RECORD] Writer error: {e}")
+
+            if not video and not audio:
+                time.sleep(0.05)
+        self._close()
+
+    def stop(self):
+        """Finish writing what is queued, then close the files; stop offering first"""
+        self.running = False
+
+    def _add_video(self, batch, parts):
+        """Reassemble the best layer of each source and queue complete frames for writing"""
+        header_end = 4 + VIDEO_HEADER.size
+        for pkt in batch:
+            layer, flags, fec_group, frame_id, index, count, total, _ = VIDEO_HEADER.unpack_from(pkt, 4)
+            if layer == LAYER_LOW:
+                continue
+            frame = self.assembler.add(pkt[:5], frame_id, index, count, total, memoryview(pkt)[header_end:], fec_group)
+            if frame is None:
+                continue
+            codec = flags & CODEC_MASK
+            extension = self.EXTENSIONS.get(codec)
+            if extension is None:
+                continue
+            if codec in INTER_FRAME_CODECS:
+                # A delta is only playable on top of every frame since the last keyframe
+                key = (pkt[:4], codec)
+                last = self.last_ids.get(key)
+                if not flags & FLAG_KEYFRAME and (last is None or frame_id != (last + 1) & FRAME_ID_MASK):
+                    self.last_ids.pop(key, None)
+                    self.stats["frames_skipped"] += 1
+                    continue
+                self.last_ids[key] = frame_id
+            parts[f"video_{socket.inet_ntoa(pkt[:4])}.{extension}"].append(bytes(frame))
+            self.stats["frames_written"] += 1
+
+    def _write(self, parts):
+        for name, chunks in parts.items():
+            data = b"".join(chunks)
+            try:
+                entry = self.files.get(name)
+                if entry is None:
+                    entry = self.files[name] = self._open(name)
+                wav, f = entry
+                if wav is not None:
+                    wav.writeframesraw(data)
+                else:
+                    f.write(data)
+                self.stats["bytes_written"] += len(data)
+            except (OSError, wave.Error) as e:
+                self.stats["write_errors"] += 1
+                logger.error(f"[RECORD] Write to {name} failed: {e}")
+
+    def _open(self, name):
+        f = open(os.path.join(self.directory, name), "wb", buffering=RECORDING_BUFFER)
+        if not name.endswith(".wav"):
+            return None, f
+        wav = wave.open(f, "wb")
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RECORDING_AUDIO_RATE)
+        return wav, f
+
+    def _flush(self):
+        """Push buffers to disk and fix up WAV headers, so a crash loses at most one interval"""
+        for name, (wav, f) in list(self.files.items()):
+            try:
+                if wav is not None:
+                    wav.writeframes(b"")
+                f.flush()
+            except (OSError, wave.Error) as e:
+                self.stats["write_errors"] += 1
+                logger.error(f"[RECORD] Flush of {name} failed: {e}")
+
+    def _close(self):
+        for name, (wav, f) in self.files.items():
+            try:
+                if wav is not None:
+                    wav.close()
+                f.close()
+            except (OSError, wave.Error) as e:
+                logger.error(f"[RECORD] Close of {name} failed: {e}")
+        self.files.clear()
+        logger.info(f"[RECORD] Stopped: {self.stats}")
+
+recorder = None
+
+# ===== Stats =====
+def stats_reporter():
+    while True:
+        time.sleep(STATS_LOG_INTERVAL)
+        v = get_video_stats()
+        logger.info(
+            f"[STATS] video recv={v['received']} malformed={v['malformed']} "
+            f"queue_drops={v['queue_drops']} sent={v['sent']} send_errors={v['send_errors']} "
+            f"kernel_rcvbuf_errors={v['kernel_rcvbuf_errors']}"
+        )
+        for target, rx in get_receiver_stats().items():
+            if rx["budget_kbps"] is not None or rx["frames_dropped"]:
+                logger.info(
+                    f"[STATS] receiver {rx['name']}@{target} budget={rx['budget_kbps']}kbps "
+                    f"rate={rx['rate_kbps']}kbps loss={rx['loss']} delay={rx['delay_ms']}ms "
+                    f"forwarded={rx['frames_forwarded']} dropped={rx['frames_dropped']}"
+                )
+        if recorder is not None:
+            r = recorder.stats
+            logger.info(
+                f"[STATS] recording frames={r['frames_written']} audio_ticks={r['audio_ticks_written']} "
+                f"bytes={r['bytes_written']} video_packets_dropped={r['video_packets_dropped']} "
+                f"audio_ticks_dropped={r['audio_ticks_dropped']} write_errors={r['write_errors']} "
+                f"errors={r['errors']}"
+            )
+
 # ===== Main Server =====
 def start_server():
+    global recorder
+    video_sock.bind((SERVER_HOST, VIDEO_UDP_PORT))
+    audio_sock.bind((SERVER_HOST, AUDIO_UDP_PORT))
+
+    writer = None
+    if RECORDING_DIR:
+        recorder = MediaRecorder(RECORDING_DIR)
+        writer = threading.Thread(target=recorder.run, name="recording-writer", daemon=True)
+        writer.start()
+
     threading.Thread(target=video_forwarder, daemon=True).start()
     threading.Thread(target=audio_receiver, daemon=True).start()
     threading.Thread(target=audio_mixer, daemon=True).start()
     threading.Thread(target=screen_relay_server, daemon=True).start()
     threading.Thread(target=file_transfer_server, daemon=True).start()
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind((SERVER_HOST, TCP_PORT))
-    s.listen(50)
-
-    logger.info(f"[TCP] Control server listening on {SERVER_HOST}:{TCP_PORT}")
+    threading.Thread(target=stats_reporter, daemon=True).start()
 
     try:
-        while True:
-            conn, addr = s.accept()
-            threading.Thread(target=handle_control, args=(conn, addr), daemon=True).start()
+        asyncio.run(control_server())
     except KeyboardInterrupt:
         logger.info("Shutting down server")
     finally:
-        s.close()
-
+        if writer is not None:
+            active, recorder = recorder, None
+            active.stop()
+            writer.join(timeout=10.0)
 
 if __name__ == "__main__":
     start_server()
@@ -0,0 +1,120 @@
+"""
+Lan Conference Video Codecs
+
+Encoders turn BGR frames into (payload, is keyframe) and decoders turn
+payloads back into BGR frames. JPEG codes every frame on its own, so any
+frame can be lost or skipped. H.264 (through PyAV, optional) codes most
+frames as differences from the previous one at a fraction of the bytes;
+a lost frame breaks the picture until the next keyframe, which comes
+every keyframe_interval frames or when forced after a receiver asks.
+"""
+
+import fractions
+
+import cv2
+import numpy as np
+
+from media import CODEC_H264, CODEC_JPEG
+
+try:
+    import av
+    AV_AVAILABLE = True
+    # PyAV >= 12 takes an enum here, older versions the picture type letter
+    _PICT_TYPE_I = av.video.frame.PictureType.I if hasattr(av.video.frame, "PictureType") else "I"
+except ImportError:
+    AV_AVAILABLE = False
+
+CODECS = {"jpeg": CODEC_JPEG, "h264": CODEC_H264}
+
+
+def jpeg_quality_to_crf(quality):
+    """Map a JPEG quality (1-100) onto an x264 CRF of similar visual quality"""
+    return int(round(min(51, max(0, 46 - 0.3 * quality))))
+
+
+class JpegEncoder:
+    codec_id = CODEC_JPEG
+
+    def encode(self, frame, quality, fps, force_keyframe=False):
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes(), True
+
+
+class JpegDecoder:
+    def decode(self, data):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class H264Encoder:
+    """libx264 tuned for live video: no B-frames or lookahead, so each frame
+    comes out as soon as it goes in. A change of size, quality or frame rate
+    reopens the encoder, which starts over with a keyframe."""
+
+    codec_id = CODEC_H264
+
+    def __init__(self, keyframe_interval):
+        self.keyframe_interval = keyframe_interval
+        self.context = None
+        self.params = None
+        self.pts = 0
+
+    def _open(self, width, height, quality, fps):
+        context = av.CodecContext.create('libx264', 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = fractions.Fraction(1, fps)
+        context.framerate = fractions.Fraction(fps, 1)
+        context.gop_size = self.keyframe_interval
+        context.max_b_frames = 0
+        context.options = {
+            "preset": "ultrafast",
+            "tune": "zerolatency",
+            "crf": str(jpeg_quality_to_crf(quality)),
+            "forced-idr": "1",
+        }
+        self.context = context
+        self.params = (width, height, quality, fps)
+        self.pts = 0
+
+    def encode(self, frame, quality, fps, force_keyframe=False):
+        height, width = frame.shape[:2]
+        if self.params != (width, height, quality, fps):
+            self._open(width, height, quality, fps)
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = self.pts
+        self.pts += 1
+        if force_keyframe:
+            video_frame.pict_type = _PICT_TYPE_I
+        packets = self.context.encode(video_frame)
+        return b"".join(bytes(p) for p in packets), any(p.is_keyframe for p in packets)
+
+
+class H264Decoder:
+    def __init__(self):
+        self.context = av.CodecContext.create('h264', 'r')
+        # Frame threading holds frames back; one thread returns each frame as its packet goes in
+        self.context.thread_count = 1
+
+    def decode(self, data):
+        frames = self.context.decode(av.Packet(data))
+        if not frames:
+            return None
+        return frames[-1].to_ndarray(format='bgr24')
+
+
+def create_encoder(name, keyframe_interval):
+    """Encoder for a VIDEO_CODEC setting, falling back to JPEG if PyAV is missing"""
+    if name == "h264":
+        if AV_AVAILABLE:
+            return H264Encoder(keyframe_interval)
+        print("[DEBUG] PyAV not available, sending JPEG video instead of H.264")
+    return JpegEncoder()
+
+def create_decoder(codec_id):
+    """Decoder for a codec id from the packet flags, or None if it can't be decoded here"""
+    if codec_id == CODEC_JPEG:
+        return JpegDecoder()
+    if codec_id == CODEC_H264 and AV_AVAILABLE:
+        return H264Decoder()
+    return None